@@ -1,4 +1,4 @@
-import util
+import coin_registry
 
 
 class Market_Adapter(object):
@@ -8,11 +8,11 @@ class Market_Adapter(object):
             raise ValueError("Invalid mode")
         self.mode = mode
         self.name = "Generic"
-        self.coin_name_array = []
+        self.coin_name_array = coin_registry.CoinRegistry([])
 
     #--------- Buy Operations ---------
     def buy_by_sub(self, sub, amount):
-        symbol = util.get_symbol_for_sub(self.coin_name_array, sub)
+        symbol = coin_registry.as_registry(self.coin_name_array).symbol_for_sub(sub)
         self.buy_by_symbol(symbol, amount)
 
     def buy_by_symbol(self, symbol, total):
@@ -20,7 +20,7 @@ class Market_Adapter(object):
     #--------- Sell Operations ---------
 
     def sell_by_sub(self, sub, amount):
-        symbol = util.get_symbol_for_sub(self.coin_name_array, sub)
+        symbol = coin_registry.as_registry(self.coin_name_array).symbol_for_sub(sub)
         self.sell_by_symbol(symbol, amount)
 
     def sell_by_symbol(self, symbol, amount):
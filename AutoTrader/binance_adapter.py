@@ -6,6 +6,7 @@ from binance.client import Client
 from binance.enums import *
 from binance.exceptions import *
 
+import coin_registry
 import settings
 import util
 from AutoTrader.adapter import Market_Adapter
@@ -18,7 +19,7 @@ class Binance_Adapter(Market_Adapter):
         Market_Adapter.__init__(self, mode)
         auth = util.get_binance_auth()
         self.client = Client(**auth)
-        self.coin_name_array = util.read_subs_from_file(settings.general["binance_file"])
+        self.coin_name_array = coin_registry.load(settings.general["binance_file"])
         self.name = "Binance"
         self.portfolio = None
         self.portfolio_has_changed = False
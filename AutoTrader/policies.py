@@ -1,13 +1,14 @@
 import datetime
 
+import coin_registry
+import database
 import query
 import util
-from database import DatabaseConnection
 from settings import autotrade
 
 log = util.setup_logger(__name__)
-auth = util.get_postgres_auth()
-db = DatabaseConnection(**auth)
+# connects lazily on the first query
+db = database.get_shared_connection()
 
 K = autotrade["k"]
 GROWTH_HOURS = autotrade["growth_hours"]
@@ -59,8 +60,9 @@ def __sell_and_spendings__(adapter, growths):
                 log.info("Not selling %s because its in the TOP %s." % (symbol, DYNAMIC_TOP_NR))
                 non_dust_coins.append(coin)
         else:
+            coins = coin_registry.as_registry(adapter.coin_name_array)
             for symbol in list(sell):
-                subs = util.get_subs_for_symbol(adapter.coin_name_array, symbol)
+                subs = coins.subs_for_symbol(symbol)
                 assert len(subs) == 1
                 if not __stagnation_detection__(subs[0]):
                     sell.remove(symbol)
@@ -68,8 +70,9 @@ def __sell_and_spendings__(adapter, growths):
                     non_dust_coins.append(coin)
 
     buy_count = max(K - len(non_dust_coins), 0)
-    buy_coins = [util.get_symbol_for_sub(adapter.get_coins(), g[0]) for g in growths[:buy_count]]
-    backup = [util.get_symbol_for_sub(adapter.get_coins(), g[0]) for g in growths[buy_count:]]
+    coins = coin_registry.as_registry(adapter.get_coins())
+    buy_coins = [coins.symbol_for_sub(g[0]) for g in growths[:buy_count]]
+    backup = [coins.symbol_for_sub(g[0]) for g in growths[buy_count:]]
     for coin in list(buy_coins):
         if coin in sell:
             if adapter.can_sell(coin):
@@ -108,22 +111,11 @@ def __stagnation_detection__(subreddit):
     """
     start_time = datetime.datetime.utcnow() - datetime.timedelta(hours=STAGNATION_HOURS)
     end_time = datetime.datetime.utcnow()
-    price_data = db.get_all_price_data_in_interval(start_time, end_time)
-    price_now = 0
-    price_xhrs_ago = 0
-    for line in price_data:
-        if line[0] == subreddit:
-            price_now = line[1]
-            break
-    for line in reversed(price_data):
-        if line[0] == subreddit:
-            price_xhrs_ago = line[1]
-            break
-    if price_now == 0 or price_xhrs_ago == 0:
+    subs, changes = query.price_changes(db, start_time, end_time, [subreddit])
+    if len(subs) == 0 or changes[0] == float('inf'):
         log.warn("No price data for %s. Assuming no stagnation." % (subreddit))
         return False
-    price_change = (price_now - price_xhrs_ago) / price_xhrs_ago
-    if price_change < STAGNATION_THRESHOLD:
+    if changes[0] < STAGNATION_THRESHOLD:
         return True
     return False
 
@@ -135,47 +127,18 @@ def __dynamic_stagnation_detection__(db, coin_name_array, symbols):
     """
     now = datetime.datetime.utcnow()
     start_time = now - datetime.timedelta(hours=STAGNATION_HOURS)
-    price_data = db.get_all_price_data_in_interval(start_time, now)
-    all_subs = []
-    price_changes = []
-    subreddit_list = []
-    # create list with all subs
-    for coin in coin_name_array:
-        all_subs.append(coin[-1])
-        if coin[-2] in symbols:
-            subreddit_list.append(coin[-1])
-
-    for subreddit in all_subs:
-        # get prices for each sub
-        price_now = 0
-        price_xhrs_ago = 0
-        for line in price_data:
-            if line[0] == subreddit:
-                price_now = line[1]
-                break
-        for line in reversed(price_data):
-            if line[0] == subreddit:
-                price_xhrs_ago = line[1]
-                break
-        # calculate price change
-        if price_now == 0 or price_xhrs_ago == 0:
-            log.warn("No price data for %s. Assuming no stagnation." % (subreddit))
-            price_change = float('inf')
-        else:
-            price_change = (price_now - price_xhrs_ago) / price_xhrs_ago
-        price_changes.append((subreddit, price_change))
-
-    price_changes = sorted(price_changes, key=lambda subr: subr[1])
-    price_changes.reverse()
-    top_gainers = [c[0] for c in price_changes[:DYNAMIC_TOP_NR]]
-    return [util.get_symbol_for_sub(coin_name_array, s) for s in subreddit_list if s in top_gainers]
+    symbols = set(symbols)
+    all_subs = [coin[-1] for coin in coin_name_array]
+    subreddit_list = [coin[-1] for coin in coin_name_array if coin[-2] in symbols]
+    top_gainers = query.top_price_gainers(db, start_time, now, DYNAMIC_TOP_NR, all_subs)
+    coins = coin_registry.as_registry(coin_name_array)
+    return [coins.symbol_for_sub(s) for s in subreddit_list if s in top_gainers]
 
 
 def subreddit_growth_policy(adapter):
     now = datetime.datetime.utcnow()
-    start_time = now - datetime.timedelta(hours=GROWTH_HOURS)
     subs = [coin[-1] for coin in adapter.get_coins()]
-    growths = query.average_growth(db, subs, start_time, now, sort=True)
+    growths = query.growth_at(db, subs, now, GROWTH_HOURS, sort=True)
     growths.reverse()
     log.info(growths)
     sell, spend = __sell_and_spendings__(adapter, growths)
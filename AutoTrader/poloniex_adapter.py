@@ -4,6 +4,7 @@ import time
 import poloniex
 from poloniex import PoloniexError
 
+import coin_registry
 import settings
 import util
 from AutoTrader.adapter import Market_Adapter
@@ -21,7 +22,7 @@ class Poloniex_Adapter(Market_Adapter):
         # timeout for buy, sell orders
         self.timeout = 90
         self.retries = 5
-        self.coin_name_array = util.read_subs_from_file(settings.general["poloniex_file"])
+        self.coin_name_array = coin_registry.load(settings.general["poloniex_file"])
 
     #--------- Buy Operations ---------
     def buy_by_symbol(self, symbol, total):
@@ -0,0 +1,100 @@
+import datetime
+
+import numpy as np
+
+import util
+
+log = util.setup_logger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+# columns of the activity table in the order used by ActivityHistogram
+ACTIVITY_METRICS = ("comments", "submissions", "mentions", "mention_score")
+
+
+def floor_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def collect_activity_dicts(coin_name_array, activities, mentions):
+    """
+    Merges the results of RedditStats.get_hourly_activity (one per coin) and
+    RedditStats.get_hourly_mentions into rows for DatabaseConnection.insert_activity_many.
+    """
+    rows = {}
+    for coin, activity, coin_mentions in zip(coin_name_array, activities, mentions):
+        subreddit = coin[-1]
+        for hour, (comments, submissions) in activity.items():
+            row = rows.setdefault((subreddit, hour), [0, 0, 0, 0.])
+            row[0], row[1] = comments, submissions
+        for hour, (count, score) in coin_mentions.items():
+            row = rows.setdefault((subreddit, hour), [0, 0, 0, 0.])
+            row[2], row[3] = row[2] + count, row[3] + score
+    return [{
+        "subreddit": subreddit,
+        "hour": datetime.datetime.utcfromtimestamp(hour),
+        "comments": row[0],
+        "submissions": row[1],
+        "mentions": row[2],
+        "mention_score": row[3],
+    } for (subreddit, hour), row in rows.items()]
+
+
+
+class ActivityHistogram(object):
+    """
+    Hourly activity counts of many subreddits loaded once from the activity table.
+    Prefix sums over the hours make the totals of any window a constant time lookup.
+    """
+
+    def __init__(self, db, subreddits, start, end):
+        self.subreddits = list(subreddits)
+        self.sub_index = {sub: i for i, sub in enumerate(self.subreddits)}
+        self.start = floor_hour(start)
+        self.num_hours = int((end - self.start) / HOUR) + 1
+        counts = np.zeros((len(self.subreddits), self.num_hours, len(ACTIVITY_METRICS)))
+        # index of the first stored hour of every subreddit (num_hours if there is none)
+        self.first_hour = np.full(len(self.subreddits), self.num_hours)
+        for row in db.get_activity(self.subreddits, self.start, self.start + self.num_hours * HOUR):
+            i, j = self.sub_index[row[0]], int((row[1] - self.start) / HOUR)
+            counts[i, j] = row[2:]
+            self.first_hour[i] = min(self.first_hour[i], j)
+        # prefix[:, j] is the sum of the first j hours
+        self.prefix = np.zeros((len(self.subreddits), self.num_hours + 1, len(ACTIVITY_METRICS)))
+        self.prefix[:, 1:] = np.cumsum(counts, axis=1)
+
+    def __hour_index__(self, timestamp):
+        return min(max(int((floor_hour(timestamp) - self.start) / HOUR), 0), self.num_hours)
+
+    def totals(self, start, end):
+        """
+        Returns an (n_subreddits, 4) array with the number of comments, submissions,
+        mentions and the mention score in all full hours from start until end.
+        """
+        return self.prefix[:, self.__hour_index__(end)] - self.prefix[:, self.__hour_index__(start)]
+
+    def rates(self, start, end):
+        """
+        Same as totals but per hour.
+        """
+        hours = max(self.__hour_index__(end) - self.__hour_index__(start), 1)
+        return self.totals(start, end) / hours
+
+    def get_rates(self, subreddit, start, end):
+        """
+        Returns the hourly rates of comments, submissions, mentions and mention score for subreddit.
+        """
+        i = self.sub_index[subreddit]
+        hours = max(self.__hour_index__(end) - self.__hour_index__(start), 1)
+        return (self.prefix[i, self.__hour_index__(end)] - self.prefix[i, self.__hour_index__(start)]) / hours
+
+    def window_rates(self, subreddit, ends, hours):
+        """
+        Returns an (n_ends, 4) array with the hourly rates of subreddit in the hours full hours before each end.
+        Windows which start before the first stored hour of subreddit are NaN.
+        """
+        i = self.sub_index[subreddit]
+        end_index = np.array([self.__hour_index__(end) for end in ends], dtype=int)
+        start_index = end_index - hours
+        rates = (self.prefix[i, end_index] - self.prefix[i, np.maximum(start_index, 0)]) / hours
+        rates[start_index < self.first_hour[i]] = np.nan
+        return rates
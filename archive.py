@@ -0,0 +1,172 @@
+import gzip
+import json
+import os
+
+import numpy as np
+
+import util
+from mentions import match_texts
+from settings import general, reddit
+
+log = util.setup_logger(__name__)
+
+HOUR_IN_SECONDS = 3600
+INDEX_FILE = "index.json"
+# number of texts matched per task of the recompute process pool
+RECOMPUTE_CHUNK_SIZE = 2000
+
+
+class TextArchive(object):
+    """
+    Append-only archive of the raw comments and submissions downloaded by the collector.
+    Every collection cycle is written as one gzip compressed JSON lines segment,
+    index.json maps each segment to the time range (created_utc) of its records,
+    the end of its cycle and the coverage of every fetched listing.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = general["archive_dir"]
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index = {}
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+
+    def append(self, records, cycle_end, coverage=None):
+        """
+        Writes records (dicts with id, subreddit, kind, created_utc, created, score and text)
+        into a new segment for the cycle ending at cycle_end.
+        coverage maps "subreddit/kind" to the timestamp since which all items of that listing
+        are in records (see RedditStats.get_archive_coverage).
+        """
+        if len(records) == 0:
+            return
+        name = "{}.jsonl.gz".format(cycle_end.strftime("%Y%m%d%H%M%S"))
+        with gzip.open(os.path.join(self.path, name), "wt") as f:
+            for record in records:
+                f.write(json.dumps(record))
+                f.write("\n")
+        created = [r["created_utc"] for r in records]
+        self.index[name] = {
+            "first": min(created),
+            "last": max(created),
+            "count": len(records),
+            "end": cycle_end.timestamp(),
+            "coverage": coverage or {},
+        }
+        self.__write_index__()
+        log.info("Archived %s texts in %s." % (len(records), name))
+
+    def prune(self, before):
+        """
+        Deletes the segments of all cycles which ended before the datetime before.
+        """
+        old = [name for name, entry in self.index.items() if entry["end"] < before.timestamp()]
+        if len(old) == 0:
+            return
+        for name in old:
+            del self.index[name]
+        self.__write_index__()
+        for name in old:
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        log.info("Deleted %s archive segments older than %s." % (len(old), before))
+
+    def __write_index__(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(self.index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+    def read(self, start, end, subreddits=None):
+        """
+        Returns all records with start <= created_utc <= end (unix timestamps) newest first.
+        Items downloaded in several cycles are returned once with their latest score.
+        """
+        if subreddits is not None:
+            subreddits = set(s.lower() for s in subreddits)
+        records = {}
+        for name in sorted(self.index):
+            first, last = self.index[name]["first"], self.index[name]["last"]
+            if last < start or first > end:
+                continue
+            with gzip.open(os.path.join(self.path, name), "rt") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if not start <= record["created_utc"] <= end:
+                        continue
+                    if subreddits is not None and record["subreddit"].lower() not in subreddits:
+                        continue
+                    records[record["id"]] = record
+        return sorted(records.values(), key=lambda r: r["created_utc"], reverse=True)
+
+    def covers(self, start, end, subreddits, kinds=("comments", "new")):
+        """
+        Is every item of every subreddit and kind with start <= created_utc <= end in the archive?
+        """
+        for subreddit in subreddits:
+            for kind in kinds:
+                key = "{}/{}".format(subreddit.lower(), kind)
+                intervals = sorted((entry["coverage"][key], entry["end"]) for entry in self.index.values()
+                                   if key in entry["coverage"])
+                covered_until = start
+                for covered_since, segment_end in intervals:
+                    if covered_since > covered_until:
+                        break
+                    covered_until = max(covered_until, segment_end)
+                if covered_until < end:
+                    return False
+        return True
+
+
+def recompute_mentions(coin_name_array, cycle_ends, hours=12, score_scaling=True, archive=None, processes=None):
+    """
+    Rebuilds the mention rates of RedditStats.get_mentions for every cycle end time
+    from the archived texts of the general subs.
+    Matching is spread over a process pool with processes workers (default: all cores).
+
+    Returns:
+        List with one tuple (count_list, first_hour_list) per cycle end,
+        None for cycle ends whose window is not completely covered by the archive.
+    """
+    if archive is None:
+        archive = TextArchive()
+    if len(cycle_ends) == 0:
+        return []
+    # one second earlier for the integer cut below
+    first_start = int(min(cycle_ends).timestamp() - hours * HOUR_IN_SECONDS) - 1
+    records = archive.read(first_start, max(cycle_ends).timestamp(), reddit["general_subs"])
+    texts = [r["text"] for r in records]
+    matches = match_texts(coin_name_array, texts, processes, RECOMPUTE_CHUNK_SIZE)
+    log.info("Matched %s archived texts." % (len(texts)))
+
+    created = np.array([r["created_utc"] for r in records])
+    # the first hour is split on created like in RedditStats.get_mentions
+    created_local = np.array([r.get("created", r["created_utc"]) for r in records])
+    weights = np.array([max(1, r["score"]*0.1) if score_scaling else 1 for r in records])
+    result = []
+    for cycle_end in cycle_ends:
+        end = cycle_end.timestamp()
+        start = end - hours * HOUR_IN_SECONDS
+        hour_ago = end - HOUR_IN_SECONDS
+        if not archive.covers(start, end, reddit["general_subs"]):
+            result.append(None)
+            continue
+        count_list = np.zeros(len(coin_name_array))
+        first_hour_list = np.zeros(len(coin_name_array))
+        # the same integer cut as the listing loops of RedditStats.get_mentions
+        in_window = np.nonzero((np.floor(created) >= int(start)) & (created <= end))[0]
+        for j in in_window:
+            for i in matches[j]:
+                count_list[i] += weights[j]
+                if int(created_local[j]) < int(hour_ago):
+                    first_hour_list[i] += weights[j]
+        if len(in_window) > 0:
+            interval_length = end - created[in_window].min()
+            count_list = count_list / (interval_length / HOUR_IN_SECONDS)
+        result.append((count_list, list(first_hour_list)))
+    return result
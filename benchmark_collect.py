@@ -0,0 +1,67 @@
+"""
+Benchmarks one reddit collection cycle (RedditStats.collect_cycle) against fake_reddit.FakeReddit
+and reports the wall time, the number of API requests and the used CPU time.
+"""
+import argparse
+import time
+
+import settings
+from fake_reddit import FakeReddit, synthetic_coin_name_array
+from reddit import RedditStats, RequestBudget
+
+
+def run_cycle(coin_name_array, latency=0., workers=1, hours=12, group_size=None, lean=None,
+              requests_per_minute=None):
+    """
+    Runs one collection cycle and returns (wall time, API requests, CPU time, requests charged to the budget).
+    group_size and lean override settings.reddit["multireddit_group_size"] and settings.reddit["lean_listings"]
+    for this cycle only.
+    If requests_per_minute is given the workers share a RequestBudget as in main.collect.
+    """
+    saved_settings = dict(settings.reddit)
+    if group_size is not None:
+        settings.reddit["multireddit_group_size"] = group_size
+    if lean is not None:
+        settings.reddit["lean_listings"] = lean
+    try:
+        budget = None if requests_per_minute is None else RequestBudget(requests_per_minute)
+        stat = RedditStats(hours=hours, budget=budget, reddit_factory=lambda: fake)
+        fake = FakeReddit(coin_name_array, latency=latency, now=stat.default_end.timestamp())
+        wall_start = time.time()
+        cpu_start = time.process_time()
+        stat.collect_cycle(coin_name_array, hours=hours, workers=workers)
+        wall, cpu = time.time() - wall_start, time.process_time() - cpu_start
+    finally:
+        settings.reddit.clear()
+        settings.reddit.update(saved_settings)
+    return (wall, fake.requests, cpu, None if budget is None else budget.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collection benchmark")
+    parser.add_argument("--sizes", default=[260, 2000], type=int, nargs="+",
+                        help="Numbers of coin subreddits.")
+    parser.add_argument("--latency", default=0.05, type=float,
+                        help="Latency of every fake API request in seconds.")
+    parser.add_argument("--workers", default=1, type=int,
+                        help="Number of collection threads.")
+    parser.add_argument("--group_size", default=None, type=int,
+                        help="Number of coin subreddits fetched as one multireddit.")
+    parser.add_argument("--lean", default=None, action="store_true",
+                        help="Fetch listings as raw JSON.")
+    parser.add_argument("--requests_per_minute", default=None, type=float,
+                        help="Pace the requests with a shared RequestBudget.")
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format("subs", "workers", "wall [s]", "requests", "charged",
+                                                          "cpu [s]"))
+    for size in args.sizes:
+        wall, requests, cpu, charged = run_cycle(synthetic_coin_name_array(size), args.latency, args.workers,
+                                                 group_size=args.group_size, lean=args.lean,
+                                                 requests_per_minute=args.requests_per_minute)
+        charged = "-" if charged is None else charged
+        print("{:>8} {:>8} {:>10.2f} {:>10} {:>10} {:>10.2f}".format(size, args.workers, wall, requests, charged, cpu))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmarks the price collection (fetch, match and insert of main.collect_price)
+against a local fake_coincap.FakeTickerServer.
+Rows are inserted into a temporary table which shadows the price table for the benchmark connection,
+the insert is skipped if no database is available.
+"""
+import argparse
+import logging
+import time
+
+import database
+from coinmarketcap import CoinCap
+from fake_coincap import FakeTickerServer
+from fake_reddit import synthetic_coin_name_array
+
+
+def connect():
+    """
+    Returns a connection whose price table is a temporary copy (or None if there is no database).
+    """
+    try:
+        db = database.get_shared_connection()
+        db.cur.execute("CREATE TEMP TABLE IF NOT EXISTS price (LIKE public.price INCLUDING ALL)")
+        db.conn.commit()
+    except Exception as e:
+        print("No database, skipping inserts: {}".format(e))
+        return None
+    return db
+
+
+def run_price_collection(num_coins, db=None):
+    """
+    Collects the prices of num_coins synthetic coins once and returns (fetch, match, insert) times in seconds.
+    """
+    coin_name_array = synthetic_coin_name_array(num_coins)
+    with FakeTickerServer(num_coins) as server:
+        cap = CoinCap(url=server.url, limit=num_coins, ttl=3600)
+        fetch_start = time.time()
+        # fills the response cache which get_price_dicts reads
+        cap.get_coin_names(num_coins)
+        match_start = time.time()
+        price_dicts = cap.get_price_dicts(coin_name_array)
+        insert_start = time.time()
+        if db is not None:
+            db.insert_price_many(price_dicts)
+        insert_end = time.time()
+    assert len(price_dicts) == num_coins
+    return (match_start - fetch_start, insert_start - match_start,
+            insert_end - insert_start if db is not None else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price collection benchmark")
+    parser.add_argument("--sizes", default=[100, 1000, 5000], type=int, nargs="+",
+                        help="Numbers of coins.")
+    parser.add_argument("--no_insert", default=False, action="store_true",
+                        help="Only fetch and match.")
+    parser.add_argument("--verbose", default=False, action="store_true",
+                        help="Keep the info logs (one line per coin) which otherwise distort the timings.")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    try:
+        db = None if args.no_insert else connect()
+        print("{:>8} {:>10} {:>10} {:>11}".format("coins", "fetch [s]", "match [s]", "insert [s]"))
+        for size in args.sizes:
+            fetch, match, insert = run_price_collection(size, db)
+            insert = "-" if insert is None else "{:.3f}".format(insert)
+            print("{:>8} {:>10.3f} {:>10.3f} {:>11}".format(size, fetch, match, insert))
+        if db is not None:
+            db.cur.execute("DROP TABLE IF EXISTS pg_temp.price")
+            db.close()
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+
+# maps path -> (modification time, CoinRegistry)
+loaded = {}
+
+
+class CoinRegistry(object):
+    """
+    Immutable coin name array (rows of id, name, symbol, subreddit) with hashed lookups
+    by subreddit, symbol, id and alias.
+    Rows are stored as tuples and the registry can be used wherever a coin_name_array is only read.
+    """
+
+    def __init__(self, coin_name_array):
+        self.coins = tuple(tuple(coin) for coin in coin_name_array)
+        # all indices map to the rows in the order of coin_name_array
+        self.by_sub = {}
+        self.by_symbol = {}
+        self.by_id = {}
+        self.by_alias = {}
+        for i, coin in enumerate(self.coins):
+            self.by_sub.setdefault(coin[-1], []).append(i)
+            self.by_symbol.setdefault(coin[-2], []).append(i)
+            self.by_id.setdefault(coin[0], []).append(i)
+            for alias in set(a.lower() for a in coin):
+                self.by_alias.setdefault(alias, []).append(i)
+
+    def __len__(self):
+        return len(self.coins)
+
+    def __iter__(self):
+        return iter(self.coins)
+
+    def __getitem__(self, i):
+        return self.coins[i]
+
+    def __first__(self, index, key):
+        indices = index.get(key)
+        if indices is None:
+            return None
+        return self.coins[indices[0]]
+
+    def coin_for_sub(self, subreddit):
+        return self.__first__(self.by_sub, subreddit)
+
+    def coin_for_symbol(self, symbol):
+        return self.__first__(self.by_symbol, symbol)
+
+    def coin_for_id(self, coin_id):
+        return self.__first__(self.by_id, coin_id)
+
+    def symbol_for_sub(self, subreddit):
+        coin = self.coin_for_sub(subreddit)
+        return None if coin is None else coin[-2]
+
+    def subs_for_symbol(self, symbol):
+        return [self.coins[i][-1] for i in self.by_symbol.get(symbol, [])]
+
+    def coins_for_alias(self, alias):
+        """
+        Returns all coins which have alias (case insensitive) as id, name, symbol or subreddit.
+        """
+        return [self.coins[i] for i in self.by_alias.get(alias.lower(), [])]
+
+    def has_symbol(self, symbol):
+        return symbol in self.by_symbol
+
+
+def as_registry(coin_name_array):
+    """
+    Returns coin_name_array as CoinRegistry (without copying if it already is one).
+    """
+    if isinstance(coin_name_array, CoinRegistry):
+        return coin_name_array
+    return CoinRegistry(coin_name_array)
+
+
+def load(path):
+    """
+    Returns the CoinRegistry of a coin csv file (e.g. settings.general["subreddit_file"]).
+    The file is only read again if it was modified.
+    """
+    # util delegates its coin lookups to this module
+    import util
+    mtime = os.path.getmtime(path)
+    if path not in loaded or loaded[path][0] != mtime:
+        loaded[path] = (mtime, CoinRegistry(util.read_subs_from_file(path)))
+    return loaded[path][1]
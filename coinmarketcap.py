@@ -1,16 +1,91 @@
+import datetime
 import json
+import os
+import threading
+import time
 
 import requests
 
 import util
+from settings import coincap
 
 log = util.setup_logger(__name__)
+
+# keep-alive session and response cache shared by all CoinCap instances of the process
+session = None
+# maps (url, limit) -> (fetch time, parsed response)
+response_cache = {}
+cache_lock = threading.Lock()
+
+
+def get_session():
+    global session
+    with cache_lock:
+        if session is None:
+            session = requests.Session()
+        return session
+
+
 class CoinCap(object):
     """
     A class which manages connections to the CoinMarketCap.com API
+    Responses are cached for ttl seconds (see settings.coincap), also on disk if cache_file is set.
+    url is the v1 ticker endpoint (e.g. of fake_coincap.FakeTickerServer), price data is
+    fetched for the top limit coins.
     """
-    def __init__(self):
-        self.url = "https://api.coinmarketcap.com/v1/ticker/"
+    def __init__(self, ttl=None, cache_file=None, url=None, limit=None):
+        self.url = coincap["url"] if url is None else url
+        self.limit = coincap["price_limit"] if limit is None else limit
+        self.ttl = coincap["ttl"] if ttl is None else ttl
+        self.cache_file = coincap["cache_file"] if cache_file is None else cache_file
+
+    def __lookup__(self, limit):
+        """
+        Returns the response for limit coins from response_cache (or None), the caller holds cache_lock.
+        A response for more coins is cut to the top limit coins.
+        """
+        now = time.time()
+        for (url, cached_limit), (fetched, data) in response_cache.items():
+            if url == self.url and cached_limit >= limit and now - fetched < self.ttl:
+                return data[:limit]
+        return None
+
+    def __cached_response__(self, limit):
+        with cache_lock:
+            data = self.__lookup__(limit)
+            if data is None and self.cache_file is not None and os.path.exists(self.cache_file):
+                with open(self.cache_file) as f:
+                    for key, (fetched, cached_data) in json.load(f):
+                        key = tuple(key)
+                        if key not in response_cache or response_cache[key][0] < fetched:
+                            response_cache[key] = (fetched, cached_data)
+                data = self.__lookup__(limit)
+        return data
+
+    def __ticker__(self, limit, description):
+        """
+        Returns the ticker of the top limit coins, from the cache if it is younger than self.ttl.
+        """
+        data = self.__cached_response__(limit)
+        if data is not None:
+            return data
+        json_url = "{}?limit={}".format(self.url, limit)
+        try:
+            resp = get_session().get(url=json_url)
+        except requests.exceptions.RequestException as e:
+            log.warn("Could not get %s: %s" % (description, str(e)))
+            raise e
+        data = json.loads(resp.text)
+        with cache_lock:
+            response_cache[(self.url, limit)] = (time.time(), data)
+            if self.cache_file is not None:
+                fresh = [[list(key), value] for key, value in response_cache.items()
+                         if time.time() - value[0] < self.ttl]
+                tmp_path = self.cache_file + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(fresh, f)
+                os.replace(tmp_path, self.cache_file)
+        return data
 
     def get_coin_values_usd(self, coin_name_array, portfolio):
         """
@@ -18,68 +93,97 @@ class CoinCap(object):
         dictionary which maps those coints to the corresponding values in USD.
         """
         price_data = self.get_coin_price_data(coin_name_array)
+        # first price entry for every symbol
+        by_symbol = {}
+        for price_dict in price_data.values():
+            by_symbol.setdefault(price_dict["symbol"], price_dict)
         d = {}
         for symb, amount in portfolio.items():
-            for api_coin, price_dict in price_data.items():
-                if price_dict["symbol"] == symb:
-                    d[symb] = amount * float(price_dict["price"])
-                    break
+            if symb in by_symbol:
+                d[symb] = amount * float(by_symbol[symb]["price"])
         return d
 
     def get_coin_names(self, count):
         """
         get the top count crypto coins
         """
-        json_url = self.url + "?limit={}".format(count)
-        try:
-            resp = requests.get(url=json_url)
-        except requests.exceptions.RequestException as e:
-            log.warn("Could not get coin names: %s" % (str(e)))
-            raise e
-        data = json.loads(resp.text)
+        data = self.__ticker__(count, "coin names")
         return [coin["id"] for coin in data]
 
     def get_coin_aliases(self, count):
         """
         get the id, name, and symbol of the top count crypto coins
         """
-        json_url = "{}?limit={}".format(self.url, count)
-        try:
-            resp = requests.get(url=json_url)
-        except requests.exceptions.RequestException as e:
-            log.warn("Could not get coin aliases: %s" % (str(e)))
-            raise e
-        data = json.loads(resp.text)
+        data = self.__ticker__(count, "coin aliases")
         return [[coin["id"], coin["name"], coin["symbol"]] for coin in data]
 
     def get_coin_price_data(self, coin_name_array):
         """
         get the price data for all coins in coin_name_array
         """
-        json_url = "{}?limit={}".format(self.url, 1000)
-        try:
-            resp = requests.get(url=json_url)
-        except requests.exceptions.RequestException as e:
-            log.warn("Could not get price data: %s" % (str(e)))
-            raise e
-        data = json.loads(resp.text)
+        data = self.__ticker__(self.limit, "price data")
+        normalized_ids = [normalize_id(api_coin["id"]) for api_coin in data]
+        index = api_coin_index(data, normalized_ids)
         d = {}
         for coin in coin_name_array:
-            matched = False
-            for api_coin in data:
-                normalized_id = "".join(x for x in api_coin["id"] if x.isalnum()).lower()
-                if (normalized_id in coin) or (api_coin["id"] in coin) or \
-                   (api_coin["name"] in coin):
-                    d[normalized_id] = {
-                        "coin_id": api_coin["id"],
-                        "coin_name": api_coin["name"],
-                        "symbol": api_coin["symbol"],
-                        "percent_change_1h": api_coin["percent_change_1h"],
-                        "percent_change_24h": api_coin["percent_change_24h"],
-                        "price": api_coin["price_usd"],
-                    }
-                    matched = True
-                    break
-            if not matched:
+            # the first entry of the response which matches any alias of coin
+            matches = [index[alias] for alias in coin if alias in index]
+            if len(matches) == 0:
                 log.warning("No match for {}".format(coin[0]))
+                continue
+            i = min(matches)
+            api_coin = data[i]
+            d[normalized_ids[i]] = {
+                "coin_id": api_coin["id"],
+                "coin_name": api_coin["name"],
+                "symbol": api_coin["symbol"],
+                "percent_change_1h": api_coin["percent_change_1h"],
+                "percent_change_24h": api_coin["percent_change_24h"],
+                "price": api_coin["price_usd"],
+            }
         return d
+
+    def get_price_dicts(self, coin_name_array, time=None):
+        """
+        Returns the price data of the coins in coin_name_array as dicts for insert_price_many.
+        """
+        if time is None:
+            time = datetime.datetime.utcnow()
+        price_data = self.get_coin_price_data(coin_name_array)
+        if (len(price_data) != len(coin_name_array)):
+            log.warning("No price data for {} coins:".format(len(coin_name_array) - len(price_data)))
+        # maps every alias to the subreddit of the first coin using it
+        subreddits = {}
+        for coin in coin_name_array:
+            for alias in coin:
+                subreddits.setdefault(alias, coin[-1])
+        price_dicts = []
+        for k, d in price_data.items():
+            d["time"] = time
+            if k in subreddits:
+                d["subreddit"] = subreddits[k]
+            if "subreddit" not in d:
+                log.warning("No subreddit for %s." % (d["coin_name"]))
+            else:
+                log.info("Got price for: %s" % (d["subreddit"]))
+                price_dicts.append(d)
+        return price_dicts
+
+
+def normalize_id(coin_id):
+    """
+    Lower case id without special characters (the format of the subreddit csv ids).
+    """
+    return "".join(x for x in coin_id if x.isalnum()).lower()
+
+
+def api_coin_index(data, normalized_ids):
+    """
+    Maps the normalized id, id and name of every entry of an API response
+    to the position of the first entry using it.
+    """
+    index = {}
+    for i, api_coin in enumerate(data):
+        for key in (normalized_ids[i], api_coin["id"], api_coin["name"]):
+            index.setdefault(key, i)
+    return index
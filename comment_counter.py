@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+
+import util
+from settings import general
+
+log = util.setup_logger(__name__)
+
+BUCKET_SECONDS = 60
+
+
+class CommentCounter(object):
+    """
+    Counts comments (and the coins they mention) per subreddit in BUCKET_SECONDS buckets
+    and remembers the newest comment already counted (high-water mark).
+    The state is persisted as JSON so that the next collection cycle only has to
+    fetch comments which are newer than the high-water mark.
+    """
+
+    def __init__(self, path=None, max_age_hours=48):
+        if path is None:
+            path = general["comment_counter_file"]
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def __sub_state__(self, subreddit):
+        return self.state.setdefault(subreddit.lower(), {
+            "newest": None,
+            "newest_ids": [],
+            "covered_since": None,
+            "buckets": {},
+            "mentions": {},
+        })
+
+    def newest(self, subreddit):
+        """
+        Returns created_utc of the newest counted comment of subreddit (or None).
+        """
+        with self.lock:
+            return self.__sub_state__(subreddit)["newest"]
+
+    def covered_since(self, subreddit):
+        """
+        Returns the timestamp since which all comments of subreddit were counted (or None).
+        """
+        with self.lock:
+            return self.__sub_state__(subreddit)["covered_since"]
+
+    def high_water_mark(self, subreddit):
+        """
+        Returns (newest, newest_ids, covered_since) of subreddit where newest_ids are the fullnames
+        of the counted comments created at newest (any of them may be None).
+        """
+        with self.lock:
+            sub_state = self.__sub_state__(subreddit)
+            return sub_state["newest"], list(sub_state.get("newest_ids", [])), sub_state["covered_since"]
+
+    def __count__(self, sub_state, created_utc, mentioned, score):
+        bucket = str(int(created_utc // BUCKET_SECONDS))
+        sub_state["buckets"][bucket] = sub_state["buckets"].get(bucket, 0) + 1
+        if len(mentioned) > 0:
+            bucket_mentions = sub_state["mentions"].setdefault(bucket, {})
+            for coin_sub in mentioned:
+                count, scaled = bucket_mentions.get(coin_sub, (0, 0.))
+                bucket_mentions[coin_sub] = (count + 1, scaled + max(1, score*0.1))
+
+    def __advance__(self, sub_state, created_utc, fullname):
+        if sub_state["newest"] is None or created_utc > sub_state["newest"]:
+            sub_state["newest"] = created_utc
+            sub_state["newest_ids"] = [fullname]
+        elif created_utc == sub_state["newest"] and fullname not in sub_state.setdefault("newest_ids", []):
+            sub_state["newest_ids"].append(fullname)
+
+    def add(self, subreddit, created_utc, fullname=None, mentioned=(), score=0):
+        """
+        Counts one streamed comment and moves the high-water mark to it.
+        mentioned is a list of subreddits of the coins mentioned in it.
+        """
+        with self.lock:
+            sub_state = self.__sub_state__(subreddit)
+            self.__count__(sub_state, created_utc, mentioned, score)
+            self.__advance__(sub_state, created_utc, fullname)
+
+    def add_fetched(self, subreddit, comments, covered_since, reset=False):
+        """
+        Counts the comments (tuples of created_utc, fullname, mentioned, score) of one complete fetch
+        and only then moves the high-water mark and covered_since together.
+        If reset is True the previous counts of subreddit are dropped first.
+        """
+        with self.lock:
+            sub_state = self.__sub_state__(subreddit)
+            if reset:
+                sub_state.update(newest=None, newest_ids=[], buckets={}, mentions={})
+            for created_utc, fullname, mentioned, score in comments:
+                self.__count__(sub_state, created_utc, mentioned, score)
+            for created_utc, fullname, _, _ in comments:
+                self.__advance__(sub_state, created_utc, fullname)
+            sub_state["covered_since"] = covered_since
+
+    def count(self, subreddit, start, end):
+        """
+        Number of comments with start < created_utc <= end (both unix timestamps).
+        """
+        first, last = int(start // BUCKET_SECONDS), int(end // BUCKET_SECONDS)
+        with self.lock:
+            buckets = self.__sub_state__(subreddit)["buckets"]
+            return sum(c for b, c in buckets.items() if first < int(b) <= last)
+
+    def mentions(self, subreddit, start, end, score_scaling=True):
+        """
+        Returns a dict which maps coin subreddits to their (score scaled) number of mentions
+        in comments of subreddit with start < created_utc <= end.
+        """
+        first, last = int(start // BUCKET_SECONDS), int(end // BUCKET_SECONDS)
+        result = {}
+        with self.lock:
+            for b, bucket_mentions in self.__sub_state__(subreddit)["mentions"].items():
+                if not first < int(b) <= last:
+                    continue
+                for coin_sub, (count, scaled) in bucket_mentions.items():
+                    result[coin_sub] = result.get(coin_sub, 0) + (scaled if score_scaling else count)
+        return result
+
+    def prune(self, now):
+        """
+        Drops all buckets older than max_age_hours.
+        """
+        oldest = int((now - self.max_age) // BUCKET_SECONDS)
+        with self.lock:
+            for sub_state in self.state.values():
+                for key in ("buckets", "mentions"):
+                    sub_state[key] = {b: v for b, v in sub_state[key].items() if int(b) >= oldest}
+                if sub_state["covered_since"] is not None:
+                    sub_state["covered_since"] = max(sub_state["covered_since"], now - self.max_age)
+
+    def save(self):
+        """
+        Atomically writes the state to path.
+        """
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
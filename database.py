@@ -1,12 +1,70 @@
 import datetime
+import itertools
+import threading
+import time
 
 import numpy as np
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
 
-from util import setup_logger
+from settings import postgres
+from util import get_postgres_auth, setup_logger
 
 log = setup_logger(__name__)
 
+PRICE_COLUMNS = ("time", "coin_id", "coin_name", "symbol", "subreddit", "price",
+                 "percent_change_1h", "percent_change_24h")
+DATA_COLUMNS = ("time", "hours", "subreddit", "subscribers", "submission_rate", "comment_rate",
+                "mention_rate", "submission_rate_1h", "comment_rate_1h", "mention_rate_1h")
+# number of rows sent per multi-row INSERT statement
+BATCH_PAGE_SIZE = 500
+
+DATA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS data_subreddit_time_idx ON data (subreddit, time);",
+    "CREATE INDEX IF NOT EXISTS data_time_idx ON data (time);",
+]
+PRICE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS price_subreddit_time_idx ON price (subreddit, time);",
+    "CREATE INDEX IF NOT EXISTS price_time_idx ON price (time);",
+]
+# key of the advisory lock held while migrating the schema
+MIGRATION_LOCK_ID = 31780
+# schema migrations, the i-th entry upgrades the schema from version i to i+1
+# only append to this list, never change existing entries
+MIGRATIONS = [
+    DATA_INDEXES + PRICE_INDEXES,
+    [
+        "CREATE TABLE IF NOT EXISTS growth (subreddit varchar, time timestamp, hours int,"
+        "subscriber_growth real, submission_growth real, comment_growth real, mention_growth real,"
+        "PRIMARY KEY (subreddit, time, hours));",
+        "CREATE INDEX IF NOT EXISTS growth_hours_time_idx ON growth (hours, time);",
+    ],
+    [
+        "CREATE TABLE IF NOT EXISTS activity (subreddit varchar, hour timestamp,"
+        "comments int, submissions int, mentions int, mention_score real,"
+        "PRIMARY KEY (subreddit, hour));",
+    ],
+]
+
+PRICE_METRICS = ("price", "percent_change_1h", "percent_change_24h")
+GROWTH_COLUMNS = ("subreddit", "time", "hours", "subscriber_growth", "submission_growth",
+                  "comment_growth", "mention_growth")
+ACTIVITY_COLUMNS = ("subreddit", "hour", "comments", "submissions", "mentions", "mention_score")
+DATA_METRICS = ("subscribers", "submission_rate", "comment_rate", "mention_rate",
+                "submission_rate_1h", "comment_rate_1h", "mention_rate_1h")
+
+
+# unique names for server-side cursors
+cursor_names = itertools.count()
+
+
+def to_epoch_seconds(timestamps):
+    """
+    Converts a sequence of naive (UTC) datetimes to a float array of seconds since epoch.
+    """
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64) / 1e6
+
 class DatabaseConnection(object):
     """
     Class for PostgreSQL connections using psycopg2
@@ -20,10 +78,7 @@ class DatabaseConnection(object):
         except:
             log.error("Could not connect to databse!")
             raise RuntimeError("Could not connect to databse!")
-        if (not self.data_table_exists()):
-            self.create_data_table()
-        if (not self.price_table_exists()):
-            self.create_price_table()
+        self.ensure_schema()
 
     def close(self):
         """
@@ -33,6 +88,51 @@ class DatabaseConnection(object):
         self.cur.close()
         self.conn.close()
 
+    def ensure_schema(self):
+        """
+        create missing tables and apply pending migrations
+        """
+        if (not self.data_table_exists()):
+            self.create_data_table()
+        if (not self.price_table_exists()):
+            self.create_price_table()
+        self.migrate()
+
+    # ------------ schema migrations ------------
+
+    def get_schema_version(self):
+        """
+        Returns the current schema version (0 if no migration was ever applied).
+        """
+        self.cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version int PRIMARY KEY);")
+        self.cur.execute("SELECT max(version) FROM schema_version;")
+        version = self.cur.fetchone()[0]
+        return 0 if version is None else version
+
+    def migrate(self):
+        """
+        Applies all pending migrations from MIGRATIONS in order.
+        Each migration runs in its own transaction together with the version bump.
+        The transactions hold an advisory lock and re-read the version, so processes
+        starting at the same time never apply the same migration twice.
+        """
+        while True:
+            try:
+                self.cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+                new_version = self.get_schema_version() + 1
+                if new_version > len(MIGRATIONS):
+                    self.conn.commit()
+                    return
+                for statement in MIGRATIONS[new_version - 1]:
+                    self.cur.execute(statement)
+                self.cur.execute("INSERT INTO schema_version (version) VALUES (%s);", (new_version,))
+                self.conn.commit()
+            except psycopg2.Error as e:
+                self.conn.rollback()
+                log.error("Schema migration failed: %s" % (str(e)))
+                raise RuntimeError("Schema migration failed.")
+            log.info("Migrated database schema to version %s." % (new_version))
+
     # ------------ price table ------------
 
     def price_table_exists(self):
@@ -47,6 +147,8 @@ class DatabaseConnection(object):
         self.cur.execute("CREATE TABLE price (id serial PRIMARY KEY, time timestamp, \
                          coin_id varchar, coin_name varchar, symbol varchar, subreddit varchar, \
                          price real, percent_change_1h real, percent_change_24h real);")
+        for statement in PRICE_INDEXES:
+            self.cur.execute(statement)
         self.conn.commit()
         log.info("Created price table.")
 
@@ -70,41 +172,198 @@ class DatabaseConnection(object):
         )
         self.conn.commit()
 
+    def insert_price_many(self, price_data_dicts):
+        """
+        insert a list of price items with multi-row INSERTs and a single commit
+        """
+        return self.__insert_many__("price", PRICE_COLUMNS, price_data_dicts)
+
 
     def get_interpolated_price_data(self, subreddit, timestamp):
         """
         Returns price, percent_change_1h, percent_change_24h
-        Created by linear interpolation using the two nearest datapoints.
-        """
-        querystr = "SELECT time, price, percent_change_1h, percent_change_24h FROM price WHERE subreddit=%s \
-                AND time > %s ORDER BY time ASC LIMIT 1"
-        self.cur.execute(querystr, (subreddit, timestamp))
-        next_newer = self.cur.fetchone()
-        querystr = "SELECT time, price, percent_change_1h, percent_change_24h FROM price WHERE subreddit=%s \
-                AND time < %s ORDER BY time DESC LIMIT 1"
-        self.cur.execute(querystr, (subreddit, timestamp))
-        next_older = self.cur.fetchone()
-        if next_newer == None and next_older == None:  # if no newer data exists return the latest data
-            log.warning("No match for %s" % (subreddit))
+        Created by linear interpolation using the two nearest datapoints (see get_interpolated_price_series).
+        """
+        series = self.get_interpolated_price_series(subreddit, [timestamp])
+        if len(series) == 0:
             return
-        elif next_newer == None:
-            return next_older[1:]
-        elif next_older == None:  # if no older data exists raise error
-            raise ValueError("Cannot interpolate for given timestamp, subreddit: {} {}".format(timestamp, subreddit))
-        # weighted interpolation
-        interval = next_newer[0] - next_older[0]
-        weight_newer = (next_newer[0] - timestamp) / interval
-        weight_older = (timestamp - next_older[0]) / interval
-        return weight_newer*np.array(next_newer[1:]) + weight_older*np.array(next_older[1:])
+        return series[0]
+
+    def get_interpolated_price_series(self, subreddits, timestamps):
+        """
+        Same as get_interpolated_price_data but for a whole list of timestamps in one query.
+        If subreddits is a string returns an (n_timestamps, 3) array,
+        otherwise a dict which maps each subreddit to such an array.
+        """
+        if isinstance(subreddits, str):
+            return self.__interpolated_series__("price", PRICE_METRICS, [subreddits], timestamps)[subreddits]
+        return self.__interpolated_series__("price", PRICE_METRICS, subreddits, timestamps)
+
+    def __interpolated_series__(self, table, metrics, subreddits, timestamps):
+        """
+        Streams all rows bracketing the timestamp grid for every subreddit from one query
+        (see __stream__) and linearly interpolates each metric column with np.interp.
+        Returns a dict which maps each subreddit to an (n_timestamps, n_metrics) array.
+        """
+        subreddits = list(subreddits)
+        timestamps = list(timestamps)
+        start, end = min(timestamps), max(timestamps)
+        querystr = """WITH bounds AS (
+                SELECT s.subreddit,
+                    (SELECT max(time) FROM {table} WHERE subreddit=s.subreddit AND time < %(start)s) AS lower_time,
+                    (SELECT min(time) FROM {table} WHERE subreddit=s.subreddit AND time > %(end)s) AS upper_time
+                FROM unnest(%(subreddits)s::varchar[]) AS s(subreddit))
+            SELECT t.subreddit, extract(epoch FROM t.time), {metrics} FROM {table} t JOIN bounds b
+            ON t.subreddit=b.subreddit
+            WHERE t.time >= COALESCE(b.lower_time, %(start)s) AND t.time <= COALESCE(b.upper_time, %(end)s)
+            ORDER BY t.subreddit, t.time ASC""".format(
+                table=table, metrics=", ".join("t." + m for m in metrics))
+        # maps subreddit -> list of (time, metrics) arrays, the rows of a subreddit are consecutive
+        chunks_by_sub = {}
+        params = {"start": start, "end": end, "subreddits": subreddits}
+        for chunk_subs, chunk in self.__stream__(querystr, params, chunks=True):
+            names = np.array(chunk_subs)
+            bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+            for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(chunk_subs)]):
+                chunks_by_sub.setdefault(chunk_subs[first], []).append(chunk[first:last])
+
+        x = to_epoch_seconds(timestamps)
+        result = {}
+        for subreddit in subreddits:
+            chunks = chunks_by_sub.get(subreddit)
+            if chunks is None:
+                log.warning("No match for %s" % (subreddit))
+                result[subreddit] = np.empty((0, len(metrics)))
+                continue
+            rows = np.concatenate(chunks)
+            xp = rows[:, 0]
+            if x.min() < xp[0]:  # if no older data exists raise error
+                raise ValueError("Cannot interpolate for given timestamp, subreddit: {} {}".format(start, subreddit))
+            if len(xp) > 1 and np.max(np.diff(xp)) > 3 * 3600:
+                log.warning("Difference of timestamps while interpolating %s is %ss" % (subreddit, np.max(np.diff(xp))))
+            fp = rows[:, 1:]
+            # np.interp returns the latest value for timestamps after the last row
+            result[subreddit] = np.column_stack([np.interp(x, xp, fp[:, i]) for i in range(len(metrics))])
+        return result
 
 
     def get_all_price_data_in_interval(self, start, end):
         """
         Returns all data points for all subreddits in the given interval (newest first).
         """
+        return list(self.stream_all_price_data_in_interval(start, end))
+
+    def stream_all_price_data_in_interval(self, start, end, itersize=None, chunks=False):
+        """
+        Streaming version of get_all_price_data_in_interval which uses a server-side cursor.
+        Yields single rows or, if chunks is True, tuples (subreddits, metrics array) of up to itersize rows.
+        """
         querystr = "SELECT subreddit, price, percent_change_1h, percent_change_24h \
                 FROM price WHERE time > %s AND time < %s ORDER BY time DESC"
-        self.cur.execute(querystr, (start, end))
+        return self.__stream__(querystr, (start, end), itersize, chunks)
+
+    def __stream__(self, querystr, params, itersize=None, chunks=False):
+        """
+        Runs querystr on a named (server-side) cursor so that at most itersize rows
+        are held in memory at once.
+        """
+        if itersize is None:
+            itersize = postgres["itersize"]
+        cur = self.conn.cursor(name="stream_{}".format(next(cursor_names)))
+        cur.itersize = itersize
+        try:
+            cur.execute(querystr, params)
+            if not chunks:
+                for row in cur:
+                    yield row
+                return
+            while True:
+                rows = cur.fetchmany(itersize)
+                if len(rows) == 0:
+                    break
+                yield [r[0] for r in rows], np.array([r[1:] for r in rows], dtype=float)
+        finally:
+            cur.close()
+
+    def get_first_and_last_price_in_interval(self, start, end, subreddits=None):
+        """
+        Returns one row (subreddit, oldest price, newest price) per subreddit with price data in the interval
+        ordered like the first appearance of the subreddits in get_all_price_data_in_interval (newest first).
+        If subreddits is given only those are returned.
+        """
+        sub_filter = "" if subreddits is None else "AND subreddit = ANY(%(subreddits)s::varchar[])"
+        querystr = """SELECT o.subreddit, o.price, n.price FROM
+            (SELECT DISTINCT ON (subreddit) subreddit, price FROM price
+                WHERE time > %(start)s AND time < %(end)s {sub_filter} ORDER BY subreddit, time ASC) o
+            JOIN (SELECT DISTINCT ON (subreddit) subreddit, price, time FROM price
+                WHERE time > %(start)s AND time < %(end)s {sub_filter} ORDER BY subreddit, time DESC) n
+            ON o.subreddit = n.subreddit ORDER BY n.time DESC""".format(sub_filter=sub_filter)
+        params = {"start": start, "end": end}
+        if subreddits is not None:
+            params["subreddits"] = list(subreddits)
+        self.cur.execute(querystr, params)
+        return self.cur.fetchall()
+
+    def get_latest_price_time(self):
+        """
+        Returns the time of the newest price data point (or None if there is none).
+        """
+        self.cur.execute("SELECT max(time) FROM price;")
+        return self.cur.fetchone()[0]
+
+    # ------------ growth table ------------
+
+    def get_latest_growth_time(self, hours):
+        """
+        Returns the newest collection time for which growth features of the given window exist (or None).
+        """
+        self.cur.execute("SELECT max(time) FROM growth WHERE hours=%s;", (hours,))
+        return self.cur.fetchone()[0]
+
+    def insert_growth_many(self, growth_dicts):
+        """
+        insert a list of growth feature items, already existing (subreddit, time, hours) are skipped
+        """
+        return self.__insert_many__("growth", GROWTH_COLUMNS, growth_dicts,
+                                    on_conflict="ON CONFLICT (subreddit, time, hours) DO NOTHING")
+
+    def get_growth_features(self, hours, timestamp, subreddits=None):
+        """
+        Returns (subreddit, time, subscriber_growth, submission_growth, comment_growth, mention_growth)
+        for the newest materialized collection before timestamp (growths are None if the metric grew from zero).
+        """
+        sub_filter = "" if subreddits is None else "AND subreddit = ANY(%(subreddits)s::varchar[])"
+        querystr = """SELECT subreddit, time, subscriber_growth, submission_growth, comment_growth, mention_growth
+            FROM growth WHERE hours=%(hours)s {} AND time =
+            (SELECT max(time) FROM growth WHERE hours=%(hours)s AND time < %(time)s)""".format(sub_filter)
+        params = {"hours": hours, "time": timestamp}
+        if subreddits is not None:
+            params["subreddits"] = list(subreddits)
+        self.cur.execute(querystr, params)
+        return self.cur.fetchall()
+
+    # ------------ activity table ------------
+
+    def insert_activity_many(self, activity_dicts):
+        """
+        insert hourly activity counts, for already existing hours the bigger counts are kept
+        (later cycles may see an hour more completely)
+        """
+        return self.__insert_many__("activity", ACTIVITY_COLUMNS, activity_dicts,
+                                    on_conflict="ON CONFLICT (subreddit, hour) DO UPDATE SET "
+                                    "comments = GREATEST(activity.comments, EXCLUDED.comments), "
+                                    "submissions = GREATEST(activity.submissions, EXCLUDED.submissions), "
+                                    "mentions = GREATEST(activity.mentions, EXCLUDED.mentions), "
+                                    "mention_score = GREATEST(activity.mention_score, EXCLUDED.mention_score)")
+
+    def get_activity(self, subreddits, start, end):
+        """
+        Returns all (subreddit, hour, comments, submissions, mentions, mention_score) rows
+        with start <= hour < end for the given subreddits.
+        """
+        querystr = "SELECT subreddit, hour, comments, submissions, mentions, mention_score FROM activity \
+                WHERE subreddit = ANY(%s::varchar[]) AND hour >= %s AND hour < %s"
+        self.cur.execute(querystr, (list(subreddits), start, end))
         return self.cur.fetchall()
 
     # ------------ data table ------------
@@ -122,6 +381,8 @@ class DatabaseConnection(object):
                          "hours int, subreddit varchar, subscribers int,"
                          "submission_rate real, comment_rate real, mention_rate real,"
                          "submission_rate_1h real, comment_rate_1h real, mention_rate_1h real);")
+        for statement in DATA_INDEXES:
+            self.cur.execute(statement)
         self.conn.commit()
         log.info("Created data table.")
 
@@ -144,6 +405,28 @@ class DatabaseConnection(object):
                           data_dict["submission_rate_1h"], data_dict["comment_rate_1h"], data_dict["mention_rate_1h"]))
         self.conn.commit()
 
+    def insert_data_many(self, data_dicts):
+        """
+        insert a list of data items with multi-row INSERTs and a single commit
+        """
+        return self.__insert_many__("data", DATA_COLUMNS, data_dicts)
+
+    def __insert_many__(self, table, columns, dicts, on_conflict=""):
+        """
+        Inserts all dicts into table using multi-row VALUES lists and commits once.
+        Returns the number of inserted rows.
+        """
+        rows = [tuple(d[c] for c in columns) for d in dicts]
+        if len(rows) == 0:
+            return 0
+        start = time.time()
+        querystr = "INSERT INTO {} ({}) VALUES %s {}".format(table, ", ".join(columns), on_conflict)
+        psycopg2.extras.execute_values(self.cur, querystr, rows, page_size=BATCH_PAGE_SIZE)
+        self.conn.commit()
+        elapsed = max(time.time() - start, 1e-6)
+        log.info("Inserted %s rows into %s in %.3fs (%.1f rows/s)." % (len(rows), table, elapsed, len(rows) / elapsed))
+        return len(rows)
+
     # ------------ data table queries------------
 
     def get_all_subreddits(self):
@@ -211,42 +494,78 @@ class DatabaseConnection(object):
         """
         Returns all data points for all subreddits in the given interval
         """
+        return list(self.stream_all_data_in_interval(start, end))
+
+    def stream_all_data_in_interval(self, start, end, itersize=None, chunks=False):
+        """
+        Streaming version of get_all_data_in_interval which uses a server-side cursor.
+        Yields single rows or, if chunks is True, tuples (subreddits, metrics array) of up to itersize rows.
+        """
         querystr = "SELECT subreddit, subscribers, submission_rate, comment_rate, mention_rate, \
                 submission_rate_1h, comment_rate_1h, mention_rate_1h FROM data WHERE \
                 time > %s AND time < %s ORDER BY time DESC"
-        self.cur.execute(querystr, (start, end))
+        return self.__stream__(querystr, (start, end), itersize, chunks)
+
+    def get_first_and_last_data_in_interval(self, start, end, subreddits=None):
+        """
+        Returns one row per subreddit with the oldest and the newest
+        (subscribers, submission_rate, comment_rate, mention_rate) in the given interval:
+        (subreddit, 4 oldest metrics, 4 newest metrics)
+        If subreddits is given only those are returned.
+        """
+        metrics = "subscribers, submission_rate, comment_rate, mention_rate"
+        sub_filter = "" if subreddits is None else "AND subreddit = ANY(%(subreddits)s::varchar[])"
+        querystr = """SELECT o.subreddit, o.subscribers, o.submission_rate, o.comment_rate, o.mention_rate,
+                n.subscribers, n.submission_rate, n.comment_rate, n.mention_rate FROM
+            (SELECT DISTINCT ON (subreddit) subreddit, {metrics} FROM data
+                WHERE time > %(start)s AND time < %(end)s {sub_filter} ORDER BY subreddit, time ASC) o
+            JOIN (SELECT DISTINCT ON (subreddit) subreddit, {metrics} FROM data
+                WHERE time > %(start)s AND time < %(end)s {sub_filter} ORDER BY subreddit, time DESC) n
+            ON o.subreddit = n.subreddit""".format(metrics=metrics, sub_filter=sub_filter)
+        params = {"start": start, "end": end}
+        if subreddits is not None:
+            params["subreddits"] = list(subreddits)
+        self.cur.execute(querystr, params)
         return self.cur.fetchall()
 
+    def get_collection_times(self, start, end):
+        """
+        Returns the distinct collection times in the data table between start and end (oldest first).
+        """
+        self.cur.execute("SELECT DISTINCT time FROM data WHERE time > %s AND time < %s ORDER BY time ASC", (start, end))
+        return [row[0] for row in self.cur.fetchall()]
+
+    def update_mention_rates(self, rows):
+        """
+        Overwrites mention_rate and mention_rate_1h of existing data rows.
+        rows: list of tuples (subreddit, time, mention_rate, mention_rate_1h)
+        """
+        querystr = "UPDATE data SET mention_rate = v.mention_rate, mention_rate_1h = v.mention_rate_1h \
+                FROM (VALUES %s) AS v(subreddit, time, mention_rate, mention_rate_1h) \
+                WHERE data.subreddit = v.subreddit AND data.time = v.time"
+        psycopg2.extras.execute_values(self.cur, querystr, rows, page_size=BATCH_PAGE_SIZE)
+        self.conn.commit()
+        log.info("Updated mention rates of %s rows." % (len(rows)))
+
     def get_interpolated_data(self, subreddit, timestamp):
         """
         Returns a metrics tuple for the subreddit for the given timestamp.
-        Created by linear intrpolation using the two nearest datapoints.
+        Created by linear intrpolation using the two nearest datapoints (see get_interpolated_series).
         """
-        querystr = "SELECT time, subscribers, submission_rate, comment_rate, mention_rate, \
-                submission_rate_1h, comment_rate_1h, mention_rate_1h FROM data WHERE subreddit=%s \
-                AND time > %s ORDER BY time ASC LIMIT 1"
-        self.cur.execute(querystr, (subreddit, timestamp))
-        next_newer = self.cur.fetchone()
-        querystr = "SELECT time, subscribers, submission_rate, comment_rate, mention_rate, \
-                submission_rate_1h, comment_rate_1h, mention_rate_1h FROM data WHERE subreddit=%s \
-                AND time < %s ORDER BY time DESC LIMIT 1"
-        self.cur.execute(querystr, (subreddit, timestamp))
-        next_older = self.cur.fetchone()
-
-        if next_newer is None and next_older is None:  # if no newer data exists return the latest data
-            log.warning("No match for %s" % (subreddit))
+        series = self.get_interpolated_series(subreddit, [timestamp])
+        if len(series) == 0:
             return []
-        elif next_newer is None:  # if no newer data exists return the latest data
-            return next_older[1:]
-        elif next_older is None:  # if no older data exists raise error
-            raise ValueError("Cannot interpolate for given timestamp, subreddit: {} {}".format(timestamp, subreddit))
-        if next_newer[0] - next_older[0] > datetime.timedelta(hours=3):
-            log.warning("Difference of timestamps while interpolating %s is %s" % (subreddit, next_newer[0] - next_older[0]))
-        # weighted interpolation
-        interval = next_newer[0] - next_older[0]
-        weight_newer = (next_newer[0] - timestamp) / interval
-        weight_older = (timestamp - next_older[0]) / interval
-        return weight_newer*np.array(next_newer[1:]) + weight_older*np.array(next_older[1:])
+        return series[0]
+
+    def get_interpolated_series(self, subreddits, timestamps):
+        """
+        Same as get_interpolated_data but for a whole list of timestamps in one query.
+        If subreddits is a string returns an (n_timestamps, 7) array,
+        otherwise a dict which maps each subreddit to such an array.
+        """
+        if isinstance(subreddits, str):
+            return self.__interpolated_series__("data", DATA_METRICS, [subreddits], timestamps)[subreddits]
+        return self.__interpolated_series__("data", DATA_METRICS, subreddits, timestamps)
 
     def get_subreddits_with_data(self, timestamp):
         """
@@ -255,3 +574,157 @@ class DatabaseConnection(object):
         querystr = "SELECT DISTINCT subreddit FROM data WHERE time < %s"
         self.cur.execute(querystr, (timestamp,))
         return [i[0] for i in self.cur.fetchall()]
+
+
+class PooledDatabaseConnection(DatabaseConnection):
+    """
+    DatabaseConnection which shares a bounded pool of connections between threads.
+    Every thread lazily gets its own connection and cursor on first use,
+    the schema is checked only once for the whole pool.
+    A thread should call close (or rollback) when it is done so that its connection
+    does not stay idle in a transaction with an old snapshot.
+    """
+
+    def __init__(self, dbname, user, password, host="localhost",
+                 min_connections=None, max_connections=None):
+        if min_connections is None:
+            min_connections = postgres["min_connections"]
+        if max_connections is None:
+            max_connections = postgres["max_connections"]
+        self.connect_args = dict(dbname=dbname, user=user, password=password, host=host)
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.schema_checked = False
+        # blocks threads while all connections are in use instead of raising PoolError
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.local = threading.local()
+        # maps thread id -> connection checked out by that thread
+        self.checked_out = {}
+        # incremented by close_all to invalidate the connections of all threads
+        self.generation = 0
+
+    def __get_pool__(self):
+        with self.pool_lock:
+            if self.pool is None:
+                try:
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.min_connections, self.max_connections, **self.connect_args)
+                except:
+                    log.error("Could not connect to databse!")
+                    raise RuntimeError("Could not connect to databse!")
+            return self.pool
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and self.local.generation != self.generation:
+            # returned by close_all
+            conn = self.local.conn = self.local.cur = None
+        if conn is None:
+            pool = self.__get_pool__()
+            self.slots.acquire()
+            try:
+                conn = pool.getconn()
+            except:
+                self.slots.release()
+                raise
+            self.local.conn = conn
+            self.local.cur = conn.cursor()
+            self.local.generation = self.generation
+            with self.pool_lock:
+                self.checked_out[threading.get_ident()] = conn
+                if not self.schema_checked:
+                    self.ensure_schema()
+                    self.schema_checked = True
+        return conn
+
+    @property
+    def cur(self):
+        self.conn
+        return self.local.cur
+
+    def close(self, commit=True):
+        """
+        commit (or roll back) and return the connection of the current thread to the pool
+        Failed transactions are always rolled back.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.generation != self.generation:
+            self.local.conn = None
+            self.local.cur = None
+            return
+        try:
+            self.local.cur.close()
+            end_transaction(conn, commit)
+        finally:
+            self.local.conn = None
+            self.local.cur = None
+            self.__release__(threading.get_ident(), conn)
+
+    def rollback(self):
+        """
+        roll back and return the connection of the current thread to the pool
+        """
+        self.close(commit=False)
+
+    def __release__(self, thread_id, conn):
+        with self.pool_lock:
+            if self.checked_out.get(thread_id) is not conn:
+                return
+            del self.checked_out[thread_id]
+            self.pool.putconn(conn)
+        self.slots.release()
+
+    def close_all(self):
+        """
+        roll back the open transactions of all threads and close all connections of the pool
+        The connections of other threads are taken away, they get a new one on their next query.
+        """
+        self.close()
+        with self.pool_lock:
+            checked_out = list(self.checked_out.items())
+        for thread_id, conn in checked_out:
+            try:
+                end_transaction(conn, commit=False)
+            except psycopg2.Error:
+                pass
+            self.__release__(thread_id, conn)
+        with self.pool_lock:
+            self.generation += 1
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+
+
+def end_transaction(conn, commit=True):
+    """
+    Commits the open transaction of conn or rolls it back if commit is False or the transaction failed.
+    """
+    if conn.closed:
+        return
+    if commit and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        try:
+            conn.commit()
+            return
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+    conn.rollback()
+
+
+shared_connection = None
+shared_connection_lock = threading.Lock()
+
+def get_shared_connection():
+    """
+    Returns the process wide PooledDatabaseConnection.
+    No connection is opened until the first query.
+    """
+    global shared_connection
+    with shared_connection_lock:
+        if shared_connection is None:
+            auth = get_postgres_auth()
+            shared_connection = PooledDatabaseConnection(**auth)
+        return shared_connection
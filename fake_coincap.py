@@ -0,0 +1,105 @@
+"""
+Local stand-in for the retired CoinMarketCap v1 ticker (https://api.coinmarketcap.com/v1/ticker/).
+Serves synthetic ticker JSON for num_coins coins whose ids, names and symbols match
+fake_reddit.synthetic_coin_name_array.
+"""
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TICKER_PATH = "/v1/ticker/"
+
+
+def synthetic_ticker(num_coins, seed=0):
+    """
+    Returns num_coins ticker entries in the format of the v1 API ordered by rank.
+    """
+    rng = random.Random(seed)
+    ticker = []
+    for i in range(num_coins):
+        price = 10 ** rng.uniform(-4, 4)
+        ticker.append({
+            "id": "fakecoin-{}".format(i),
+            "name": "Fakecoin{}".format(i),
+            "symbol": "FK{}".format(i),
+            "rank": str(i + 1),
+            "price_usd": "{:.8f}".format(price),
+            "price_btc": "{:.8f}".format(price / 10000.),
+            "24h_volume_usd": "{:.1f}".format(price * rng.uniform(1e3, 1e7)),
+            "market_cap_usd": "{:.1f}".format(price * rng.uniform(1e5, 1e9)),
+            "percent_change_1h": "{:.2f}".format(rng.gauss(0, 1)),
+            "percent_change_24h": "{:.2f}".format(rng.gauss(0, 5)),
+            "percent_change_7d": "{:.2f}".format(rng.gauss(0, 10)),
+            "last_updated": "1514764800",
+        })
+    return ticker
+
+
+class FakeTickerServer(object):
+    """
+    Serves the v1 ticker (?limit=n, limit=0 returns all coins) on localhost in a background thread.
+    """
+
+    def __init__(self, num_coins, port=0, seed=0):
+        self.ticker = synthetic_ticker(num_coins, seed)
+        ticker = self.ticker
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.rstrip("/") != TICKER_PATH.rstrip("/"):
+                    self.send_error(404)
+                    return
+                limit = int(parse_qs(url.query).get("limit", ["100"])[0])
+                body = json.dumps(ticker if limit == 0 else ticker[:limit]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}{}".format(self.server.server_address[1], TICKER_PATH)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake CoinMarketCap v1 ticker server")
+    parser.add_argument("--coins", default=1000, type=int, help="Number of synthetic coins.")
+    parser.add_argument("--port", default=8000, type=int, help="Port to listen on.")
+    args = parser.parse_args()
+    server = FakeTickerServer(args.coins, port=args.port)
+    print("Serving {} coins on {} (set settings.coincap[\"url\"]).".format(args.coins, server.url))
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import random
+import threading
+import time
+import zlib
+
+import settings
+
+HOUR_IN_SECONDS = 3600
+PAGE_SIZE = 100
+WORDS = ["the", "price", "moon", "hodl", "dip", "buy", "sell", "wallet", "exchange", "team",
+         "roadmap", "fork", "whale", "pump", "dump", "chart", "volume", "news", "partnership", "staking"]
+
+
+class FakeSubredditRef(object):
+
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+    def __str__(self):
+        return self.display_name
+
+
+class FakeItem(object):
+    """
+    Comment or submission with the attributes used by RedditStats.
+    """
+
+    def __init__(self, fullname, subreddit, created_utc, score, text, kind):
+        self.name = fullname
+        self.id = fullname[3:]
+        self.subreddit = FakeSubredditRef(subreddit)
+        self.created_utc = created_utc
+        self.created = created_utc
+        self.score = score
+        if kind == "comments":
+            self.body = text
+        else:
+            self.title = text
+
+
+class FakeSubreddit(object):
+
+    def __init__(self, reddit, display_name, subscribers=None):
+        self.reddit = reddit
+        self.display_name = display_name
+        # already known subscriber count (subreddits returned by FakeReddit.info)
+        self.known_subscribers = subscribers
+        self.public_description = "A crypto currency community."
+        self.description = "A crypto currency community."
+
+    def __parts__(self):
+        return [part.lower() for part in self.display_name.split("+")]
+
+    def items(self, kind):
+        """
+        Returns all items of the (multi)reddit newest first.
+        """
+        items = []
+        for part in self.__parts__():
+            items += self.reddit.get_items(part, kind)
+        if len(self.__parts__()) > 1:
+            items = sorted(items, key=lambda item: item.created_utc, reverse=True)
+        return items
+
+    def __listing__(self, kind, limit):
+        items = self.items(kind)
+        if limit is not None:
+            items = items[:limit]
+        # one request per page like the real listing generators
+        for i in range(0, max(len(items), 1), PAGE_SIZE):
+            self.reddit.record_request()
+            for item in items[i:i + PAGE_SIZE]:
+                yield item
+
+    def comments(self, limit=100):
+        return self.__listing__("comments", limit)
+
+    def new(self, limit=100):
+        return self.__listing__("new", limit)
+
+    @property
+    def subscribers(self):
+        if self.known_subscribers is not None:
+            return self.known_subscribers
+        self.reddit.record_request()
+        return self.reddit.get_subscribers(self.display_name.lower())
+
+
+class FakeReddit(object):
+    """
+    Local stand-in for the subset of praw.Reddit which is used by RedditStats.
+    Listings are either replayed from recorded items (see from_records) or generated
+    deterministically for every subreddit. Every request sleeps latency seconds and is counted.
+    """
+
+    def __init__(self, coin_name_array=(), latency=0., now=None, history_hours=48, seed=0):
+        self.coin_name_array = list(coin_name_array)
+        self.latency = latency
+        self.now = time.time() if now is None else now
+        self.history_hours = history_hours
+        self.seed = seed
+        self.general_subs = set(sub.lower() for sub in settings.reddit["general_subs"])
+        self.listings = {}
+        self.subscriber_counts = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        # if set listings which were not recorded are empty instead of generated
+        self.replay = False
+
+    @classmethod
+    def from_records(cls, records, latency=0., now=None):
+        """
+        Creates a FakeReddit which replays archived records (see archive.TextArchive).
+        """
+        fake = cls(latency=latency, now=now)
+        fake.replay = True
+        for r in sorted(records, key=lambda r: r["created_utc"], reverse=True):
+            kind = "comments" if r["kind"] == "comments" else "new"
+            fake.listings.setdefault((r["subreddit"].lower(), kind), []).append(
+                FakeItem(r["id"], r["subreddit"], r["created_utc"], r["score"], r["text"], kind))
+        if now is None and len(records) > 0:
+            fake.now = max(r["created_utc"] for r in records)
+        return fake
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def request(self, method="GET", path="", params=None):
+        """
+        Raw JSON listing endpoint (r/<subreddit>/comments or r/<subreddit>/new) as used by reddit.LeanListing.
+        """
+        params = params or {}
+        _, display_name, kind = path.strip("/").split("/")
+        items = FakeSubreddit(self, display_name).items(kind)
+        first = 0
+        if params.get("after") is not None:
+            first = [item.name for item in items].index(params["after"]) + 1
+        limit = int(params.get("limit", PAGE_SIZE))
+        page = items[first:first + limit]
+        self.record_request()
+        children = []
+        for item in page:
+            data = {
+                "name": item.name,
+                "subreddit": item.subreddit.display_name,
+                "created_utc": item.created_utc,
+                "created": item.created,
+                "score": item.score,
+            }
+            if kind == "comments":
+                data["body"] = item.body
+            else:
+                data["title"] = item.title
+            children.append({"kind": item.name[:2], "data": data})
+        after = page[-1].name if first + limit < len(items) and len(page) > 0 else None
+        return {"kind": "Listing", "data": {"after": after, "children": children}}
+
+    def subreddit(self, display_name):
+        return FakeSubreddit(self, display_name)
+
+    def info(self, subreddits=None):
+        """
+        Yields the subreddits with their subscriber counts, one request per 100 subreddits like /api/info.
+        """
+        subreddits = list(subreddits or [])
+        for i in range(0, len(subreddits), PAGE_SIZE):
+            self.record_request()
+            for name in subreddits[i:i + PAGE_SIZE]:
+                yield FakeSubreddit(self, name, self.get_subscribers(name.lower()))
+
+    def get_subscribers(self, subreddit):
+        with self.lock:
+            if subreddit not in self.subscriber_counts:
+                rng = random.Random(self.seed + zlib.crc32(subreddit.encode()))
+                self.subscriber_counts[subreddit] = int(10 ** rng.uniform(2, 6))
+            return self.subscriber_counts[subreddit]
+
+    def get_items(self, subreddit, kind):
+        """
+        Returns all items of subreddit newest first, synthetic listings are generated on first access.
+        """
+        with self.lock:
+            if (subreddit, kind) not in self.listings:
+                self.listings[(subreddit, kind)] = [] if self.replay else self.__generate__(subreddit, kind)
+            return self.listings[(subreddit, kind)]
+
+    def __generate__(self, subreddit, kind):
+        rng = random.Random(self.seed + zlib.crc32((subreddit + kind).encode()))
+        if subreddit in self.general_subs:
+            per_hour = rng.uniform(100, 400)
+        else:
+            # long tail of mostly quiet coin subreddits
+            per_hour = 10 ** rng.uniform(-1.5, 1.7)
+        if kind == "new":
+            per_hour /= 10.
+        items = []
+        created = self.now
+        oldest = self.now - self.history_hours * HOUR_IN_SECONDS
+        prefix = "t1_" if kind == "comments" else "t3_"
+        while True:
+            created -= rng.expovariate(per_hour / HOUR_IN_SECONDS)
+            if created < oldest:
+                break
+            words = [rng.choice(WORDS) for _ in range(rng.randint(3, 30))]
+            if subreddit in self.general_subs and len(self.coin_name_array) > 0 and rng.random() < 0.3:
+                coin = rng.choice(self.coin_name_array)
+                words.insert(rng.randint(0, len(words)), rng.choice(coin))
+            fullname = "{}{:08x}{}".format(prefix, zlib.crc32(subreddit.encode()), len(items))
+            items.append(FakeItem(fullname, subreddit, created, rng.randint(-2, 80), " ".join(words), kind))
+        return items
+
+
+def synthetic_coin_name_array(num):
+    """
+    Returns num synthetic coins in the format of csv/subreddits.csv (id, name, symbol, subreddit).
+    """
+    return [["fakecoin-{}".format(i), "Fakecoin{}".format(i), "FK{}".format(i), "fakecoin{}".format(i)]
+            for i in range(num)]
@@ -3,37 +3,63 @@ import argparse
 import datetime
 import os
 
+import archive
 import AutoTrader
+import coin_registry
+import database
+import query
+import settings
 import simulator
 import util
 from coinmarketcap import CoinCap
-from database import DatabaseConnection
-from reddit import RedditStats
+from comment_counter import CommentCounter
+from reddit import RedditStats, RequestBudget
+from scheduler import Job, Scheduler
 from settings import general
 from simulator import policies
 
 log = util.setup_logger(__name__)
 
-def collect(coin_name_array, hours=12):
+def create_reddit_stats(workers=1):
+    """
+    Returns a RedditStats for collect.
+    If workers > 1 the workers share a budget of settings.reddit["requests_per_minute"].
+    """
+    budget = None
+    if workers > 1:
+        budget = RequestBudget(settings.reddit["requests_per_minute"])
+    counter = None
+    if settings.reddit["incremental_comments"]:
+        counter = CommentCounter()
+    return RedditStats(budget=budget, counter=counter)
+
+def collect(coin_name_array, hours=12, workers=1, stat=None):
     """
     Collects the reddit data for the coins in coin_name_array.
     coin_name_array should be a 2D array where each row contains keywords for a crypto coin
     and the last one is the subreddit
+    If workers > 1 the subreddits are collected concurrently.
+    stat is a RedditStats from create_reddit_stats which is reused between calls (e.g. by the daemon).
     """
-    stat = RedditStats()
-    auth = util.get_postgres_auth()
-    db = DatabaseConnection(**auth)
-    mentions = stat.get_mentions(coin_name_array, hours=hours,
-                                 include_submissions=True, score_scaling=True)
-    log.info("Got mentions for all subs.")
-    for i, coin_tuple in enumerate(coin_name_array):
-        subreddit = coin_tuple[-1]
-        # print(subreddit)
-        stats_dict = stat.compile_dict(subreddit, hours=hours)
-        stats_dict["mention_rate"] = mentions[0][i]
-        stats_dict["mention_rate_1h"] = mentions[1][i]
-        db.insert_data(stats_dict)
-        log.info("Got stats for: %s" % (subreddit))
+    if stat is None:
+        stat = create_reddit_stats(workers)
+    stat.new_cycle()
+    counter = stat.counter
+    db = database.get_shared_connection()
+    stats_dicts, activity_dicts = stat.collect_cycle(coin_name_array, hours=hours, workers=workers)
+    if counter is not None:
+        counter.prune(stat.default_end.timestamp())
+        counter.save()
+    if settings.reddit["archive_texts"]:
+        # only the general subs are used by recompute_mentions
+        general_subs = settings.reddit["general_subs"]
+        text_archive = archive.TextArchive()
+        text_archive.append(stat.get_archive_records(general_subs), stat.default_end,
+                            stat.get_archive_coverage(general_subs))
+        text_archive.prune(stat.default_end - datetime.timedelta(hours=settings.reddit["archive_retention_hours"]))
+    db.insert_data_many(stats_dicts)
+    db.insert_activity_many(activity_dicts)
+    query.refresh_growth_features(db, [coin_tuple[-1] for coin_tuple in coin_name_array])
     db.close()
 
 
@@ -41,26 +67,66 @@ def collect_price(coin_name_array):
     """
     Collects the price data for the coins in coin_name_list.
     """
-    auth = util.get_postgres_auth()
-    db = DatabaseConnection(**auth)
-    cap = CoinCap()
-    time = datetime.datetime.utcnow()
-    price_data = cap.get_coin_price_data(coin_name_array)
-    if (len(price_data) != len(coin_name_array)):
-        log.warning("No price data for {} coins:".format(len(coin_name_array) - len(price_data)))
-    for k, d in price_data.items():
-        d["time"] = time
-        for coin in coin_name_array:
-            if k in coin:
-                d["subreddit"] = coin[-1]
-                break
-        if "subreddit" not in d:
-            log.warning("No subreddit for %s." % (d["coin_name"]))
-        else:
-            log.info("Got price for: %s" % (d["subreddit"]))
-            db.insert_price(d)
+    db = database.get_shared_connection()
+    price_dicts = CoinCap().get_price_dicts(coin_name_array)
+    db.insert_price_many(price_dicts)
     db.close()
 
+def recompute_mentions(coin_name_array, hours_back, hours=12):
+    """
+    Recomputes the mention rates of all data rows of the last hours_back hours from the text archive.
+    """
+    db = database.get_shared_connection()
+    end = datetime.datetime.utcnow()
+    cycle_ends = db.get_collection_times(end - datetime.timedelta(hours=hours_back), end)
+    mentions = archive.recompute_mentions(coin_name_array, cycle_ends, hours=hours)
+    rows = []
+    for cycle_end, cycle_mentions in zip(cycle_ends, mentions):
+        if cycle_mentions is None:
+            log.info("Keeping the mention rates of %s, the archive does not cover its window." % (cycle_end))
+            continue
+        count_list, first_hour_list = cycle_mentions
+        for i, coin in enumerate(coin_name_array):
+            rows.append((coin[-1], cycle_end, float(count_list[i]), float(first_hour_list[i])))
+    db.update_mention_rates(rows)
+    db.close()
+
+def release_connection(job):
+    """
+    Wraps a daemon job so that the database connection of its thread is returned to the pool
+    after every run, rolled back if the run failed.
+    """
+    def run():
+        db = database.get_shared_connection()
+        try:
+            job()
+        except:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return run
+
+def run_daemon(file_path, workers=1, exchange=""):
+    """
+    Runs collect, collect_price and (if exchange is given) the auto trader on the intervals
+    of settings.daemon in one process until interrupted.
+    Database connections, reddit sessions, the exchange client and the coin csv are kept between runs.
+    """
+    jobs = []
+    if settings.daemon["collect_interval"] > 0:
+        stat = create_reddit_stats(workers)
+        jobs.append(Job("collect", settings.daemon["collect_interval"], release_connection(
+            lambda: collect(coin_registry.load(file_path), workers=workers, stat=stat))))
+    if settings.daemon["collect_price_interval"] > 0:
+        jobs.append(Job("collect_price", settings.daemon["collect_price_interval"], release_connection(
+            lambda: collect_price(coin_registry.load(file_path)))))
+    if exchange != "" and settings.daemon["auto_trade_interval"] > 0:
+        auto = AutoTrader.AutoTrader(exchange)
+        jobs.append(Job("auto_trade", settings.daemon["auto_trade_interval"], release_connection(auto.run)))
+    Scheduler(jobs, settings.daemon["stats_file"]).run()
+    database.get_shared_connection().close_all()
+
 def create_coin_name_array(num):
     """
     create a list of crypto currencies with their subreddits
@@ -88,6 +154,12 @@ def main():
                         help="Delete and recreate the data table.")
     parser.add_argument("--collect", default=False, action='store_true',
                         help="Collect subreddit information into the database.")
+    parser.add_argument("--workers", default=1, type=int, action='store',
+                        help="Number of threads used by --collect.")
+    parser.add_argument("--stream_comments", default=False, action='store_true',
+                        help="Keep the comment counters up to date until interrupted.")
+    parser.add_argument("--recompute_mentions", default=0, type=int, action='store',
+                        help="Recompute the mention rates of the last x hours from the text archive.")
     parser.add_argument("--collect_price", default=False, action='store_true',
                         help="Collect coin price information into the database.")
     parser.add_argument("--run_sim", default=False, action='store_true',
@@ -96,16 +168,25 @@ def main():
                         help="Find coins and subreddits using 'symbols.csv'.")
     parser.add_argument("--auto_trade", type=str, default="",
                         help="Run auto trader for specified exchange.")
+    parser.add_argument("--daemon", default=False, action='store_true',
+                        help="Run collect, collect_price and --auto_trade on the intervals in settings.daemon.")
     args = parser.parse_args()
     # -----------------------------------
 
+    if args.daemon:
+        if os.path.exists(file_path):
+            run_daemon(file_path, workers=args.workers, exchange=args.auto_trade)
+        else:
+            log.info("Daemon called but %s does not exist." % (file_path))
+            log.info("Run --find_subs first.")
+        return
+
     if args.find_subs > 0:
         subs = create_coin_name_array(args.find_subs)
         util.write_subs_to_file(file_path, subs)
 
     if args.recreate_table:
-        auth = util.get_postgres_auth()
-        db = DatabaseConnection(**auth)
+        db = database.get_shared_connection()
         db.delete_data_table()
         db.create_data_table()
         db.close()
@@ -113,11 +194,28 @@ def main():
     if args.collect:
         if os.path.exists(file_path):
             subs = util.read_subs_from_file(file_path)
-            collect(subs)
+            collect(subs, workers=args.workers)
         else :
             log.info("Collect called but %s does not exist." % (file_path))
             log.info("Run --find_subs first.")
 
+    if args.recompute_mentions > 0:
+        if os.path.exists(file_path):
+            subs = util.read_subs_from_file(file_path)
+            recompute_mentions(subs, args.recompute_mentions)
+        else:
+            log.info("Recompute mentions called but %s does not exist." % (file_path))
+            log.info("Run --find_subs first.")
+
+    if args.stream_comments:
+        if os.path.exists(file_path):
+            subs = util.read_subs_from_file(file_path)
+            stat = RedditStats(counter=CommentCounter())
+            stat.stream_comments(subs)
+        else:
+            log.info("Stream comments called but %s does not exist." % (file_path))
+            log.info("Run --find_subs first.")
+
     if args.collect_price:
         if os.path.exists(file_path):
             subs = util.read_subs_from_file(file_path)
@@ -0,0 +1,86 @@
+import multiprocessing
+import re
+import threading
+
+WORD_REGEX = re.compile(r"\w+", re.UNICODE)
+
+
+class MentionMatcher(object):
+    """
+    Finds all coins mentioned in a text in a single pass over its words.
+    Every alias is split into words and looked up as an n-gram of the words of the text,
+    so matches respect word boundaries and ignore case.
+    """
+
+    def __init__(self, coin_name_array):
+        # maps a tuple of lower case words to the indices of the coins using it as alias
+        self.aliases = {}
+        # first words of aliases with more than one word
+        self.prefixes = set()
+        self.max_words = 1
+        for i, coin_name_tuple in enumerate(coin_name_array):
+            for alias in coin_name_tuple:
+                words = tuple(WORD_REGEX.findall(alias.lower()))
+                if len(words) == 0:
+                    continue
+                self.aliases.setdefault(words, set()).add(i)
+                if len(words) > 1:
+                    self.prefixes.add(words[0])
+                    self.max_words = max(self.max_words, len(words))
+
+    def match(self, text):
+        """
+        Returns the set of indices (into coin_name_array) of all coins mentioned in text.
+        """
+        words = WORD_REGEX.findall(text.lower())
+        found = set()
+        for j, word in enumerate(words):
+            coins = self.aliases.get((word,))
+            if coins is not None:
+                found |= coins
+            if word in self.prefixes:
+                for n in range(2, self.max_words + 1):
+                    coins = self.aliases.get(tuple(words[j:j + n]))
+                    if coins is not None:
+                        found |= coins
+        return found
+
+
+# number of texts matched per task of a process pool
+MATCH_CHUNK_SIZE = 1000
+
+# process pools by number of processes, kept for the whole run because every spawned
+# worker imports the main module again (multiprocessing terminates them at exit)
+pools = {}
+pools_lock = threading.Lock()
+# the matcher of a worker process for the coin_name_array of its last task
+worker_matcher = (None, None)
+
+def get_pool(processes):
+    with pools_lock:
+        if processes not in pools:
+            pools[processes] = multiprocessing.get_context("spawn").Pool(processes)
+        return pools[processes]
+
+def __match_chunk__(args):
+    global worker_matcher
+    coins, texts = args
+    if worker_matcher[0] != coins:
+        worker_matcher = (coins, MentionMatcher(coins))
+    return [sorted(worker_matcher[1].match(text)) for text in texts]
+
+
+def match_texts(coin_name_array, texts, processes=1, chunk_size=MATCH_CHUNK_SIZE):
+    """
+    Returns a sorted list of the indices of the coins mentioned in each of texts.
+    If processes is not 1 the texts are split into chunks of chunk_size which are
+    matched by a process pool with processes workers (None: all cores).
+    The workers are spawned instead of forked because the collection threads (and the
+    jobs of main.run_daemon) may hold locks which a forked child would inherit locked.
+    """
+    if processes == 1 or len(texts) <= chunk_size:
+        matcher = MentionMatcher(coin_name_array)
+        return [sorted(matcher.match(text)) for text in texts]
+    coins = tuple(tuple(coin) for coin in coin_name_array)
+    chunks = [(coins, texts[i:i + chunk_size]) for i in range(0, len(texts), chunk_size)]
+    return [m for chunk in get_pool(processes).map(__match_chunk__, chunks) for m in chunk]
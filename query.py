@@ -5,14 +5,18 @@ import time
 
 import numpy as np
 
+import database
 import util
-from database import DatabaseConnection
-from settings import general
+from activity import ActivityHistogram
+from settings import general, growth_features
+from training_data import TrainingDataStore
 
 # TODO better error handling
 # TODO different timescales
 
 log = util.setup_logger(__file__)
+# smallest difference of two timestamps in the database, ends intervals which include their end
+TIME_RESOLUTION = datetime.timedelta(microseconds=1)
 
 def calc_mean_growth(metrics):
     assert len(metrics) == 2
@@ -28,6 +32,35 @@ def calc_mean_growth(metrics):
             growths.append((m1-m2)/m2)
     return np.mean(growths)
 
+def relative_growths(old_metrics, new_metrics):
+    """
+    Returns the relative growth of every metric for (n, m) arrays of old and new metrics.
+    No change from zero counts as zero growth, growth from zero is NaN.
+    """
+    old_metrics = np.asarray(old_metrics, dtype=float)
+    new_metrics = np.asarray(new_metrics, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growths = (new_metrics - old_metrics) / old_metrics
+    growths[(old_metrics == 0) & (new_metrics == 0)] = 0.
+    growths[~np.isfinite(growths)] = np.nan
+    return growths
+
+def mean_of_valid(growths):
+    """
+    Mean of each row of growths skipping NaN entries (NaN if the row has none).
+    """
+    growths = np.asarray(growths, dtype=float)
+    valid = np.isfinite(growths)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(valid, growths, 0.).sum(axis=1) / valid.sum(axis=1)
+
+def mean_growths(old_metrics, new_metrics):
+    """
+    Vectorized calc_mean_growth for (n, m) arrays of old and new metrics.
+    Returns an array with the mean relative growth of each row.
+    """
+    return mean_of_valid(relative_growths(old_metrics, new_metrics))
+
 def recent_growth(db, subreddits):
     mean_growths = []
     for subr in subreddits:
@@ -38,16 +71,22 @@ def recent_growth(db, subreddits):
     sorted_growths = sorted(mean_growths, key=lambda subr: subr[1])
     return sorted_growths
 
-def averaged_interval_growth_rate(db, subreddit, start, end, weights=None):
+def interval_time_list(start, end):
     """
-    Calculates the average growth_rate for the for metrics relative to their baseline.
+    Returns the hourly timestamps from start to end and the length of the interval in hours.
     """
     hour = datetime.timedelta(hours=1)
     total_hours = (end - start).seconds / 3600. + (end-start).days * 24
     time_list = [start + hour*x for x in range(int(total_hours) + 1)]
-    metrics = np.array([db.get_interpolated_data(subreddit, timestamp) for timestamp in time_list])
+    return time_list, total_hours
+
+def growth_rate_from_metrics(metrics, total_hours):
+    """
+    Calculates the growth rates for an (n_timestamps, n_metrics) array of hourly interpolated metrics.
+    """
+    metrics = np.array(metrics, dtype=float)
     # calc subscriber rate from data
-    subscriber_rate = np.array([metrics[i, 0] - metrics[i-1, 0] for i in range(1, len(metrics))])
+    subscriber_rate = np.diff(metrics[:, 0])
     submission_rate = metrics[:, 1]
     comment_rate = metrics[:, 2]
     mention_rate = metrics[:, 3]
@@ -63,6 +102,41 @@ def averaged_interval_growth_rate(db, subreddit, start, end, weights=None):
     # return np.average([subscriber_rate_growth, submission_rate_growth, comment_rate_growth, mention_rate_growth], weights=weights)
     return np.array([subscriber_rate_growth, submission_rate_growth, comment_rate_growth, mention_rate_growth])
 
+def activity_histogram(db, subreddits, start, end):
+    """
+    Returns the ActivityHistogram for the rates of the hourly timestamps from start to end
+    or None if growth_features["activity_rates"] is not set.
+    """
+    if not growth_features["activity_rates"]:
+        return None
+    return ActivityHistogram(db, subreddits, start - datetime.timedelta(hours=growth_features["activity_rate_hours"]), end)
+
+def with_activity_rates(metrics, activity, subreddit, time_list):
+    """
+    Replaces the interpolated submission, comment and mention rates of metrics (rows of time_list)
+    by the rates counted in the activity table wherever it covers the whole rate window.
+    """
+    metrics = np.array(metrics, dtype=float)
+    if len(metrics) == 0:
+        return metrics
+    rates = activity.window_rates(subreddit, time_list, growth_features["activity_rate_hours"])
+    # submissions, comments and mention score like submission_rate, comment_rate and mention_rate
+    rates = rates[:, [1, 0, 3]]
+    covered = ~np.isnan(rates).any(axis=1)
+    metrics[covered, 1:4] = rates[covered]
+    return metrics
+
+def averaged_interval_growth_rate(db, subreddit, start, end, weights=None):
+    """
+    Calculates the average growth_rate for the for metrics relative to their baseline.
+    """
+    time_list, total_hours = interval_time_list(start, end)
+    metrics = db.get_interpolated_series(subreddit, time_list)
+    activity = activity_histogram(db, [subreddit], start, end)
+    if activity is not None:
+        metrics = with_activity_rates(metrics, activity, subreddit, time_list)
+    return growth_rate_from_metrics(metrics, total_hours)
+
 def sub_and_price_growths(db, coin_name_array, end, hours=24, include_future_growth=True):
     """
     Collects the average interval growths and outputs them together with
@@ -70,25 +144,53 @@ def sub_and_price_growths(db, coin_name_array, end, hours=24, include_future_gro
     """
     start = end - datetime.timedelta(hours=hours)
     growth_time = end + datetime.timedelta(hours=hours)
+    subreddits = [coin[-1] for coin in coin_name_array]
+    time_list, total_hours = interval_time_list(start, end)
+    metrics = db.get_interpolated_series(subreddits, time_list)
+    prices = db.get_interpolated_price_series(subreddits, [end, growth_time])
+    activity = activity_histogram(db, subreddits, start, end)
     data = []
-    for coin in coin_name_array:
-        row = averaged_interval_growth_rate(db, coin[-1], start, end)
+    for subreddit in subreddits:
+        sub_metrics = metrics[subreddit]
+        if activity is not None:
+            sub_metrics = with_activity_rates(sub_metrics, activity, subreddit, time_list)
+        row = growth_rate_from_metrics(sub_metrics, total_hours)
         # add growth in last 24hrs
-        row = np.append(row, db.get_interpolated_price_data(coin[-1], end)[2])
+        row = np.append(row, prices[subreddit][0, 2])
         # add growth in next 24hrs (prediction target)
         if include_future_growth:
-            row = np.append(row, db.get_interpolated_price_data(coin[-1], growth_time)[2])
-        log.info("{} {}".format(coin[-1], row))
+            row = np.append(row, prices[subreddit][1, 2])
+        log.info("{} {}".format(subreddit, row))
         data.append(row)
     data = np.array(data)
     return data
 
-def prep_training_data(db, coin_name_array, timestep, steps):
-    hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+def prep_training_data(db, coin_name_array, timestep, steps, store=None, hours=24):
+    """
+    Materializes the training data for the last steps end times (timestep apart).
+    Only (end time, coin) pairs which are not in the store yet are computed.
+    End times whose label (price growth in the hours after end) is not observable yet are skipped,
+    they are added by a later run once the price data exists.
+    """
+    if store is None:
+        store = TrainingDataStore()
+    latest_price_time = db.get_latest_price_time()
+    if latest_price_time is None:
+        log.warn("No price data, no training data can be prepared.")
+        return
+    # align to full hours so that the end times of different runs coincide
+    hour_ago = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=1)
     end_list = [hour_ago - timestep*i for i in range(1, steps+1)]
     for end in end_list:
-        data = sub_and_price_growths(db, coin_name_array, end, include_future_growth=True)
-        util.export_to_csv("data.csv", data, append=True)
+        if end + datetime.timedelta(hours=hours) > latest_price_time:
+            log.info("Label of %s is not observable yet, skipping." % (end))
+            continue
+        missing = set(store.missing(end, [coin[-1] for coin in coin_name_array]))
+        if len(missing) == 0:
+            continue
+        coins = [coin for coin in coin_name_array if coin[-1] in missing]
+        data = sub_and_price_growths(db, coins, end, hours=hours, include_future_growth=True)
+        store.add(end, [coin[-1] for coin in coins], data)
 
 def prep_prediction_data(db, coin_name_array):
     growths = sub_and_price_growths(db, coin_name_array, datetime.datetime.utcnow(), include_future_growth=False)
@@ -103,28 +205,59 @@ def prep_prediction_data(db, coin_name_array):
     print(sorted_means)
     util.export_to_csv("pred.csv", preds, append=False)
 
+def price_changes(db, start, end, subreddits=None, include_missing=False):
+    """
+    Ranks subreddits by the relative change of their coin price (newest / oldest - 1) in the interval.
+    Subreddits with a zero or missing price get an infinite change, i.e. they are never considered stagnating.
+    Subreddits without any price data are only included (with infinite change) if include_missing is set.
+    Ties (e.g. all infinite changes) are ranked in reverse input order, i.e. the order of subreddits if given,
+    otherwise the order of the newest prices.
+
+    Returns:
+        Tuple of arrays (subreddits, changes) sorted from the biggest gainer to the biggest loser.
+    """
+    if subreddits is not None:
+        subreddits = list(subreddits)
+    rows = db.get_first_and_last_price_in_interval(start, end, subreddits)
+    if subreddits is not None:
+        rows_by_sub = {row[0]: row for row in rows}
+        rows = [rows_by_sub[sub] for sub in subreddits if sub in rows_by_sub]
+    subs = [row[0] for row in rows]
+    prices = np.array([row[1:] for row in rows], dtype=float).reshape(-1, 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = (prices[:, 1] - prices[:, 0]) / prices[:, 0]
+    changes[(prices[:, 1] == 0) | ~np.isfinite(changes)] = float('inf')
+    if include_missing and subreddits is not None:
+        changes_by_sub = dict(zip(subs, changes))
+        for sub in subreddits:
+            if sub not in changes_by_sub:
+                log.warn("No price data for %s. Assuming no stagnation." % (sub))
+        subs = subreddits
+        changes = np.array([changes_by_sub.get(sub, float('inf')) for sub in subs], dtype=float)
+    # same order as sorting ascending (stable) and reversing
+    order = np.argsort(changes, kind="stable")[::-1]
+    return np.array(subs, dtype=object)[order], changes[order]
+
+def top_price_gainers(db, start, end, n, subreddits=None):
+    """
+    Returns the set of the n subreddits with the biggest price change in the interval.
+    If subreddits is given subreddits without price data count as top gainers.
+    """
+    subs, changes = price_changes(db, start, end, subreddits, include_missing=True)
+    return set(subs[:n])
+
 def percentage_price_growths(db, subreddits, start, end, sort=True):
-    price_data = db.get_all_price_data_in_interval(start, end)
+    subreddits = list(subreddits)
+    rows = db.get_first_and_last_price_in_interval(start, end, subreddits)
+    prices_by_sub = {row[0]: row[1:] for row in rows}
     result = []
     for sub in subreddits:
-        # find first price
-        found_row = False
-        for row in price_data:
-            if row[0] == sub:
-                price1 = row[1]
-                found_row = True
-                break
-        if not found_row:
+        if sub not in prices_by_sub:
             log.warn("No price data for {} in interval {} to {}".format(sub, start, end))
             continue
             # raise ValueError("No price data for {} in interval {} to {}".format(sub, start, end))
-
-        # find last price
-        for row in reversed(price_data):
-            if row[0] == sub:
-                price2 = row[1]
-                break
-        result.append([sub, (price2 - price1) / price1 * 100])
+        oldest, newest = prices_by_sub[sub]
+        result.append([sub, (oldest - newest) / newest * 100])
     if sort:
         result = sorted(result, key=lambda subr: subr[1])
     return result
@@ -134,30 +267,99 @@ def average_growth(db, subreddits, start_time, end_time, sort=True):
     Returns the subreddit with the biggest (relative) mean growth in the last 12hrs.
     Calculates the growth for the interval timestamp - hours until timestamp.
     """
-    data_points = db.get_all_data_in_interval(start_time, end_time)
-    result = []
+    subreddits = list(subreddits)
+    rows = db.get_first_and_last_data_in_interval(start_time, end_time, subreddits)
+    metrics_by_sub = {row[0]: row[1:] for row in rows}
+    found_subs = []
     for sub in subreddits:
-        # find first price
-        found_row = False
-        for row in data_points:
-            if row[0] == sub:
-                metrics1 = row[1:5]
-                found_row = True
-                break
-        if not found_row:
+        if sub in metrics_by_sub:
+            found_subs.append(sub)
+        else:
             log.warn("No subreddit data for {} in interval {} to {}".format(sub, start_time, end_time))
-            continue
-            # raise ValueError("No price data for {} in interval {} to {}".format(sub, start, end))
-        # find last price
-        for row in reversed(data_points):
-            if row[0] == sub:
-                metrics2 = row[1:5]
-                break
-        result.append([sub, calc_mean_growth([metrics1, metrics2])])
+    if len(found_subs) == 0:
+        return []
+    metrics = np.array([metrics_by_sub[sub] for sub in found_subs], dtype=float)
+    growths = mean_growths(old_metrics=metrics[:, :4], new_metrics=metrics[:, 4:])
+    result = [[sub, growth] for sub, growth in zip(found_subs, growths)]
     if sort:
         result = sorted(result, key=lambda subr: subr[1])
     return result
 
+def refresh_growth_features(db, subreddits, end=None):
+    """
+    Materializes the growths of average_growth (relative change of every metric from the oldest
+    to the newest data point in the window) for every collection since the last refresh
+    and every window in growth_features["windows"].
+    The window of a collection ends with (and includes) the data of that collection.
+    """
+    if end is None:
+        end = datetime.datetime.utcnow()
+    subreddits = list(subreddits)
+    for window in growth_features["windows"]:
+        first = end - datetime.timedelta(hours=growth_features["backfill_hours"])
+        latest = db.get_latest_growth_time(window)
+        if latest is not None:
+            first = max(first, latest)
+        growth_dicts = []
+        for growth_time in db.get_collection_times(first, end):
+            rows = db.get_first_and_last_data_in_interval(growth_time - datetime.timedelta(hours=window),
+                                                          growth_time + TIME_RESOLUTION, subreddits)
+            if len(rows) == 0:
+                continue
+            metrics = np.array([row[1:] for row in rows], dtype=float)
+            growths = relative_growths(old_metrics=metrics[:, :4], new_metrics=metrics[:, 4:])
+            for row, g in zip(rows, growths):
+                g = [None if np.isnan(x) else float(x) for x in g]
+                growth_dicts.append({
+                    "subreddit": row[0],
+                    "time": growth_time,
+                    "hours": window,
+                    "subscriber_growth": g[0],
+                    "submission_growth": g[1],
+                    "comment_growth": g[2],
+                    "mention_growth": g[3],
+                })
+        db.insert_growth_many(growth_dicts)
+        log.info("Refreshed %sh growth features from %s to %s." % (window, first, end))
+
+def materialized_growth(db, subreddits, timestamp, hours, sort=True):
+    """
+    Reads the growths of average_growth from the newest collection before timestamp.
+    Subreddits without a materialized row are computed from the data for that collection.
+    Returns a list of [subreddit, growth] like average_growth or None if that collection
+    is not materialized or more than an hour old.
+    """
+    subreddits = list(subreddits)
+    rows = db.get_growth_features(hours, timestamp, subreddits)
+    if len(rows) == 0 or rows[0][1] <= timestamp - datetime.timedelta(hours=1):
+        return None
+    growth_time = rows[0][1]
+    if len(db.get_collection_times(growth_time, timestamp)) > 0:
+        return None
+    growths = mean_of_valid([row[2:] for row in rows])
+    result = [[row[0], growth] for row, growth in zip(rows, growths)]
+    found = set(row[0] for row in rows)
+    missing = [sub for sub in subreddits if sub not in found]
+    if len(missing) > 0:
+        result += average_growth(db, missing, growth_time - datetime.timedelta(hours=hours),
+                                 growth_time + TIME_RESOLUTION, sort=False)
+    if sort:
+        result = sorted(result, key=lambda subr: subr[1])
+    return result
+
+def growth_at(db, subreddits, end_time, hours, sort=True):
+    """
+    average_growth of the hours before end_time.
+    Read from the growth table if growth_features["use_materialized"] is set and the newest
+    collection before end_time is materialized.
+    """
+    if growth_features["use_materialized"] and hours in growth_features["windows"]:
+        result = materialized_growth(db, subreddits, end_time, hours, sort)
+        if result is not None:
+            return result
+        log.info("No materialized %sh growths at %s, computing them from the data." % (hours, end_time))
+    return average_growth(db, subreddits, end_time - datetime.timedelta(hours=hours), end_time, sort)
+
 def covariance(db, subreddits):
     days = 1
     delta = datetime.timedelta(hours=12)
@@ -181,8 +383,7 @@ def main():
     # coin_name_array = util.read_subs_from_file(general["subreddit_file"])
     # coin_name_array = util.read_subs_from_file(general["binance_file"])
     coin_name_array = util.read_subs_from_file(general["poloniex_file"])
-    auth = util.get_postgres_auth()
-    db = DatabaseConnection(**auth)
+    db = database.get_shared_connection()
     # all_subreddits = db.get_all_subreddits()
     all_subreddits = [coin[-1] for coin in coin_name_array]
     start_time = datetime.datetime.utcnow() - datetime.timedelta(hours=12)
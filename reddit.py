@@ -1,30 +1,372 @@
+import collections
 import datetime
+import itertools
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import praw
 
+import activity
 import settings
 import util
 from coinmarketcap import CoinCap
+from mentions import MentionMatcher, match_texts
 
 log = util.setup_logger(__name__)
 
 HOUR_IN_SECONDS = 3600
 GENERAL_SUBS = settings.reddit["general_subs"]
+# reddit returns at most 100 items per listing request
+LISTING_PAGE_SIZE = 100
+# number of subreddits combined into one multireddit comment stream
+STREAM_GROUP_SIZE = 50
+# longest pause (in seconds) between polls of the comment streams while no new comments arrive
+STREAM_MAX_PAUSE = 30
+# number of subreddits whose metadata is returned by one /api/info request
+INFO_BATCH_SIZE = 100
+
+
+class RequestBudget(object):
+    """
+    Thread safe request pacer which keeps all threads sharing it
+    below requests_per_minute API requests.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60. / requests_per_minute
+        self.lock = threading.Lock()
+        self.next_time = time.time()
+        self.requests = 0
+
+    def acquire(self, cost=1):
+        """
+        Blocks until cost requests may be made.
+        """
+        with self.lock:
+            now = time.time()
+            wait = self.next_time - now
+            self.next_time = max(self.next_time, now) + cost * self.interval
+            self.requests += cost
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CachedListing(object):
+    """
+    Wraps a lazy praw listing so that it can be iterated any number of times
+    (also from several threads) while every item is fetched only once.
+    """
+
+    def __init__(self, listing, covered_since=None):
+        self.generator = iter(listing)
+        self.items = []
+        self.exhausted = False
+        self.lock = threading.Lock()
+        # unix timestamp since which the listing is known to contain all items (see prefetch_listings)
+        self.covered_since = covered_since
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i < len(self.items):
+                yield self.items[i]
+                i += 1
+                continue
+            with self.lock:
+                if i < len(self.items):
+                    continue
+                if self.exhausted:
+                    return
+                try:
+                    item = next(self.generator)
+                except StopIteration:
+                    self.exhausted = True
+                    return
+                self.items.append(item)
+
+
+class SubredditRef(object):
+    """
+    Stands in for the praw Subreddit of a LeanItem, one instance per subreddit and listing.
+    """
+    __slots__ = ["display_name"]
+
+    def __init__(self, display_name):
+        self.display_name = display_name
+
+
+class LeanItem(collections.namedtuple("LeanItem", ["name", "subreddit", "created_utc", "created", "score", "text"])):
+    """
+    Comment or submission reduced to the fields read by RedditStats.
+    """
+    __slots__ = ()
+
+    @property
+    def body(self):
+        return self.text
+
+    @property
+    def title(self):
+        return self.text
+
+
+class LeanListing(object):
+    """
+    Iterates a listing (e.g. r/a+b/comments) page by page through the raw JSON API
+    and yields LeanItems instead of full praw objects.
+    """
+
+    def __init__(self, reddit, path, limit=LISTING_PAGE_SIZE):
+        self.reddit = reddit
+        self.path = path
+        self.limit = limit
+
+    def __iter__(self):
+        subreddits = {}
+        after = None
+        remaining = self.limit
+        while remaining > 0:
+            params = {"limit": min(remaining, LISTING_PAGE_SIZE), "raw_json": 1}
+            if after is not None:
+                params["after"] = after
+            response = self.reddit.request(method="GET", path=self.path, params=params)
+            children = response["data"]["children"]
+            for child in children:
+                data = child["data"]
+                subreddit = subreddits.get(data["subreddit"])
+                if subreddit is None:
+                    subreddit = subreddits[data["subreddit"]] = SubredditRef(data["subreddit"])
+                yield LeanItem(data["name"], subreddit, data["created_utc"], data.get("created", data["created_utc"]),
+                               data["score"], data["body"] if "body" in data else data["title"])
+            remaining -= len(children)
+            after = response["data"]["after"]
+            if after is None or len(children) == 0:
+                return
 
 
 class RedditStats(object):
 
-    def __init__(self, hours=12):
-        auth = util.get_reddit_auth()
-        self.reddit = praw.Reddit(**auth)
+    def __init__(self, hours=12, budget=None, counter=None, reddit_factory=None, mention_processes=None,
+                 lean_listings=None):
+        if reddit_factory is None:
+            auth = util.get_reddit_auth()
+            reddit_factory = lambda: praw.Reddit(**auth)
+        # returns a praw.Reddit compatible object (e.g. fake_reddit.FakeReddit for benchmarks)
+        self.reddit_factory = reddit_factory
+        # praw is not thread safe => one instance per thread
+        self.local = threading.local()
+        self.budget = budget
+        # optional CommentCounter, if given only comments newer than its high-water marks are fetched
+        self.counter = counter
+        # number of processes matching mentions (1: match in this process, None: all cores)
+        if mention_processes is None:
+            mention_processes = settings.reddit["mention_processes"]
+        self.mention_processes = mention_processes
+        # fetch listings as raw JSON (LeanListing) instead of praw objects
+        if lean_listings is None:
+            lean_listings = settings.reddit["lean_listings"]
+        self.lean_listings = lean_listings
+        self.hours = hours
+        self.new_cycle()
 
+    def new_cycle(self):
+        """
+        Starts a new collection cycle ending now and drops all cached listings.
+        """
         # start yesterday
-        self.hours = hours
-        self.default_start = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+        self.default_start = datetime.datetime.utcnow() - datetime.timedelta(hours=self.hours)
         # end now
         self.default_end = datetime.datetime.utcnow()
+        # maps (endpoint, subreddit) -> CachedListing, subscriber count or mention matches
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+    @property
+    def reddit(self):
+        reddit = getattr(self.local, "reddit", None)
+        if reddit is None:
+            reddit = self.reddit_factory()
+            self.local.reddit = reddit
+        return reddit
+
+    def __request__(self):
+        """
+        Takes one request from the budget (blocks until it may be made).
+        """
+        if self.budget is not None:
+            self.budget.acquire()
+
+    def __paced__(self, listing, limit):
+        """
+        Yields the items of the lazy listing and takes one request from the budget
+        before every page is fetched, so only pages which are actually requested are charged.
+        """
+        iterator = iter(listing)
+        num_items = 0
+        while num_items < limit:
+            if num_items % LISTING_PAGE_SIZE == 0:
+                self.__request__()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            yield item
+            num_items += 1
+
+    def __cached__(self, key, fetch):
+        with self.cache_lock:
+            if key in self.cache:
+                return self.cache[key]
+        # fetch without holding the lock so other threads are not blocked by slow requests
+        value = fetch()
+        with self.cache_lock:
+            return self.cache.setdefault(key, value)
+
+    def __listing__(self, subreddit, kind, limit):
+        """
+        Returns the lazy comments (kind "comments") or new submissions (kind "new") listing of subreddit.
+        """
+        if self.lean_listings:
+            listing = LeanListing(self.reddit, "r/{}/{}".format(subreddit, kind), limit)
+        elif kind == "comments":
+            listing = self.reddit.subreddit(subreddit).comments(limit=limit)
+        else:
+            listing = self.reddit.subreddit(subreddit).new(limit=limit)
+        return self.__paced__(listing, limit)
+
+    def get_comments(self, subreddit, limit=1024):
+        """
+        Returns the newest comments of subreddit, fetched at most once per cycle.
+        """
+        def fetch():
+            return CachedListing(self.__listing__(subreddit, "comments", limit))
+        return self.__cached__(("comments", subreddit.lower(), limit), fetch)
+
+    def get_new_submissions(self, subreddit):
+        """
+        Returns the newest submissions of subreddit, fetched at most once per cycle.
+        """
+        def fetch():
+            return CachedListing(self.__listing__(subreddit, "new", LISTING_PAGE_SIZE))
+        return self.__cached__(("new", subreddit.lower()), fetch)
+
+    def prefetch_listings(self, subreddits, start, limit=1024, group_size=None, workers=1):
+        """
+        Fetches the comments and new submissions of subreddits as multireddits (r/a+b+c)
+        of group_size subreddits and splits the items by item.subreddit.
+        Subreddits whose items since start (unix timestamp) are all contained in the combined listing
+        are cached for get_comments and get_new_submissions, the busiest subreddits of a group
+        which is not covered are fetched separately later.
+        Comments are not prefetched if self.counter is set.
+        """
+        if group_size is None:
+            group_size = settings.reddit["multireddit_group_size"]
+        subreddits = sorted(set(sub.lower() for sub in subreddits if sub != ""))
+        if group_size <= 1 or len(subreddits) == 0:
+            return
+        kinds = ["new"] if self.counter is not None else ["comments", "new"]
+        groups = [(subreddits[i:i + group_size], kind) for kind in kinds
+                  for i in range(0, len(subreddits), group_size)]
+        fetch_group = lambda group: self.__prefetch_group__(group[0], group[1], start, limit)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                separate = sum(executor.map(fetch_group, groups), [])
+        else:
+            separate = sum(map(fetch_group, groups), [])
+        log.info("Prefetched listings of %s subreddits, %s listings are fetched separately."
+                 % (len(subreddits), len(separate)))
+
+    def __prefetch_group__(self, group, kind, start, limit):
+        """
+        Returns the subreddits of group which have to be fetched separately.
+        """
+        listing = self.__listing__("+".join(group), kind, limit)
+        items = []
+        # the listing ended before the limit => all items of the group are included
+        covered_since = float("-inf")
+        try:
+            for item in listing:
+                items.append(item)
+                if item.created_utc < start:
+                    # older pages are not needed
+                    covered_since = item.created_utc
+                    break
+        except:
+            log.warn("Could not get multireddit listing of %s subreddits." % (len(group)))
+            return group
+        if len(items) >= limit:
+            covered_since = items[-1].created_utc
+        per_sub = {sub: [] for sub in group}
+        for item in items:
+            per_sub.setdefault(item.subreddit.display_name.lower(), []).append(item)
+        if covered_since < start:
+            key = lambda sub: (kind, sub, 1024) if kind == "comments" else (kind, sub)
+            with self.cache_lock:
+                for sub in group:
+                    self.cache.setdefault(key(sub), CachedListing(per_sub[sub], covered_since))
+            return []
+        # the busiest subreddits filled the listing => fetch them separately and retry with the rest
+        mean = float(len(items)) / len(group)
+        busy = [sub for sub in group if len(per_sub[sub]) >= mean]
+        rest = [sub for sub in group if len(per_sub[sub]) < mean]
+        if len(rest) <= 1:
+            return group
+        return busy + self.__prefetch_group__(rest, kind, start, limit)
+
+    def __archived_listings__(self, subreddits=None):
+        """
+        Returns (key, CachedListing) of the listings fetched in this cycle, only those of subreddits if given.
+        """
+        if subreddits is not None:
+            subreddits = set(sub.lower() for sub in subreddits)
+        with self.cache_lock:
+            listings = [(key, value) for key, value in self.cache.items() if isinstance(value, CachedListing)]
+        return [(key, listing) for key, listing in listings if subreddits is None or key[1].lower() in subreddits]
+
+    def get_archive_records(self, subreddits=None):
+        """
+        Returns the raw comments and submissions fetched in this cycle as dicts for TextArchive.
+        Only already downloaded items (of subreddits if given) are returned, no new requests are made.
+        """
+        records = []
+        for key, listing in self.__archived_listings__(subreddits):
+            kind, subreddit = key[0], key[1]
+            for item in list(listing.items):
+                records.append({
+                    "id": item.name,
+                    "subreddit": subreddit,
+                    "kind": kind,
+                    "created_utc": item.created_utc,
+                    "created": item.created,
+                    "score": item.score,
+                    "text": item.body if kind == "comments" else item.title,
+                })
+        return records
+
+    def get_archive_coverage(self, subreddits=None):
+        """
+        Returns a dict which maps "subreddit/kind" of every listing fetched in this cycle to the
+        unix timestamp since which get_archive_records contains all of its items (0: all items).
+        """
+        coverage = {}
+        for key, listing in self.__archived_listings__(subreddits):
+            kind, subreddit = key[0], key[1]
+            limit = key[2] if kind == "comments" else LISTING_PAGE_SIZE
+            items = list(listing.items)
+            if listing.covered_since is not None:
+                covered_since = listing.covered_since
+            elif listing.exhausted and len(items) < limit:
+                # the listing ended before the limit => there are no older items
+                covered_since = 0
+            elif len(items) > 0:
+                covered_since = min(item.created_utc for item in items)
+            else:
+                continue
+            coverage["{}/{}".format(subreddit, kind)] = max(covered_since, 0)
+        return coverage
 
     def get_num_submissions_per_hour(self, subreddit, hours=None, end=None):
 
@@ -41,7 +383,7 @@ class RedditStats(object):
         if end is None:
             end = self.default_end
         start_one = end - datetime.timedelta(hours=1)
-        submissions_new = [s for s in self.reddit.subreddit(subreddit).new()]
+        submissions_new = list(self.get_new_submissions(subreddit))
         # assumes there were less than 100 submissions in the last x hours
         num_submission_x_h = len([s for s in submissions_new if s.created_utc > start.timestamp() and s.created_utc < end.timestamp()])
         num_submission_one_h = len([s for s in submissions_new if s.created_utc > start_one.timestamp() and s.created_utc < end.timestamp()])
@@ -49,7 +391,33 @@ class RedditStats(object):
         return (num_per_h_in_x_h, num_submission_one_h)
 
     def get_num_subscribers(self, subreddit):
-        return (self.reddit.subreddit(subreddit).subscribers)
+        def fetch():
+            self.__request__()
+            return self.reddit.subreddit(subreddit).subscribers
+        return self.__cached__(("subscribers", subreddit.lower()), fetch)
+
+    def prefetch_subscribers(self, subreddits):
+        """
+        Fetches the subscriber counts of all subreddits with one /api/info request
+        per INFO_BATCH_SIZE subreddits and caches them for get_num_subscribers.
+        Subreddits which are not returned (e.g. banned ones) are left to get_num_subscribers.
+        """
+        with self.cache_lock:
+            missing = sorted(set(sub.lower() for sub in subreddits if sub != "" and
+                                 ("subscribers", sub.lower()) not in self.cache))
+        for i in range(0, len(missing), INFO_BATCH_SIZE):
+            batch = missing[i:i + INFO_BATCH_SIZE]
+            self.__request__()
+            try:
+                subscribers = {sub.display_name.lower(): sub.subscribers
+                               for sub in self.reddit.info(subreddits=batch)}
+            except:
+                log.warn("Could not get subscribers of %s subreddits." % (len(batch)))
+                continue
+            with self.cache_lock:
+                for sub, count in subscribers.items():
+                    self.cache.setdefault(("subscribers", sub), count)
+        log.info("Prefetched subscribers of %s subreddits." % (len(missing)))
 
     def get_num_comments_per_hour(self, subreddit, hours=None):
         if hours is None:
@@ -57,7 +425,9 @@ class RedditStats(object):
         else:
             start = self.default_end - datetime.timedelta(hours=hours)
         start_one = self.default_end - datetime.timedelta(hours=1)
-        comm = self.reddit.subreddit(subreddit).comments(limit=1024)
+        if self.counter is not None:
+            return self.__counted_comments_per_hour__(subreddit, start, start_one)
+        comm = self.get_comments(subreddit, limit=1024)
 
         cntagg = 0
         cntone = 0
@@ -66,13 +436,16 @@ class RedditStats(object):
             for c in comm:
                 if c.created_utc > self.default_end.timestamp():
                     continue
-                cntagg += 1
-                if c.created_utc > int(start_one.timestamp()):
-                    cntone += 1
                 if c.created_utc < int(start.timestamp()):
                     exit_by_break = True
                     break
+                cntagg += 1
+                if c.created_utc > int(start_one.timestamp()):
+                    cntone += 1
                 last_created = c.created_utc
+            if not exit_by_break and comm.covered_since is not None and comm.covered_since <= start.timestamp():
+                # the prefetched listing contains all comments since start
+                exit_by_break = True
         except:
             log.warn("Could not get comment rate for subreddit: %s. It may be private or banned."
                      % (subreddit))
@@ -94,6 +467,143 @@ class RedditStats(object):
             comments_per_sec_in_1_h = float(cntone)/HOUR_IN_SECONDS
         return (comments_per_sec_in_x_h*HOUR_IN_SECONDS, comments_per_sec_in_1_h*HOUR_IN_SECONDS)
 
+    def update_comment_counter(self, subreddit, start, matcher=None, coin_subs=None):
+        """
+        Counts all comments of subreddit which are newer than the high-water mark of self.counter.
+        If the counter has no coverage of subreddit yet comments are counted back to start (unix timestamp).
+        If a MentionMatcher is given the subreddits (coin_subs) of the mentioned coins are counted, too.
+        The counter is only changed once the listing was read completely.
+
+        Returns:
+            The timestamp since which all comments of subreddit are counted.
+        """
+        newest, newest_ids, covered_since = self.counter.high_water_mark(subreddit)
+        # without coverage the counts can not be continued => count everything since start again
+        full_fetch = newest is None or covered_since is None
+        fetched = []
+        oldest_seen = None
+        num_items = 0
+        complete = False
+        for c in self.get_comments(subreddit, limit=1024):
+            if c.created_utc < (start if full_fetch else newest):
+                complete = True
+                break
+            num_items += 1
+            oldest_seen = c.created_utc
+            if not full_fetch and c.created_utc == newest and c.name in newest_ids:
+                continue
+            mentioned = []
+            if matcher is not None:
+                mentioned = [coin_subs[i] for i in matcher.match(c.body)]
+            fetched.append((c.created_utc, c.name, mentioned, c.score))
+        # the listing ended before the limit => there are no older comments
+        complete = complete or num_items < 1024
+        if full_fetch:
+            covered_since = start if complete else oldest_seen
+        elif not complete and oldest_seen is not None:
+            # the listing ended before the high-water mark => there is a gap
+            covered_since = oldest_seen
+        self.counter.add_fetched(subreddit, fetched, covered_since, reset=full_fetch)
+        return covered_since
+
+    def __counted_comments_per_hour__(self, subreddit, start, start_one):
+        """
+        get_num_comments_per_hour using the counts of self.counter
+        """
+        try:
+            covered_since = self.update_comment_counter(subreddit, start.timestamp())
+        except:
+            log.warn("Could not get comment rate for subreddit: %s. It may be private or banned."
+                     % (subreddit))
+            return (None, None)
+        end = self.default_end.timestamp()
+        covered_since = max(covered_since, start.timestamp())
+        cntagg = self.counter.count(subreddit, covered_since, end)
+        cntone = self.counter.count(subreddit, start_one.timestamp(), end)
+        if cntagg <= 1 or covered_since >= end:
+            comments_per_sec_in_x_h = 0.
+        else:
+            # if not all comments in the interval were seen extrapolate from the covered interval
+            comments_per_sec_in_x_h = float(cntagg)/(end - covered_since)
+        if cntone <= 1:
+            comments_per_sec_in_1_h = 0.
+        else:
+            comments_per_sec_in_1_h = float(cntone)/HOUR_IN_SECONDS
+        return (comments_per_sec_in_x_h*HOUR_IN_SECONDS, comments_per_sec_in_1_h*HOUR_IN_SECONDS)
+
+    def stream_comments(self, coin_name_array, save_interval=60):
+        """
+        Keeps self.counter up to date by streaming the comments of all coin subreddits
+        and GENERAL_SUBS. Runs until interrupted and saves the counter every save_interval seconds.
+        """
+        matcher = MentionMatcher(coin_name_array)
+        coin_subs = [coin[-1] for coin in coin_name_array]
+        general_subs = set(sub.lower() for sub in GENERAL_SUBS)
+        subs = coin_subs + GENERAL_SUBS
+        # close the gap between the last cycle and the start of the streams
+        for sub in subs:
+            try:
+                self.update_comment_counter(sub, self.default_start.timestamp(),
+                                            matcher if sub.lower() in general_subs else None, coin_subs)
+            except:
+                log.warn("Could not get comments for subreddit: %s. It may be private or banned." % (sub))
+        groups = [subs[i:i + STREAM_GROUP_SIZE] for i in range(0, len(subs), STREAM_GROUP_SIZE)]
+        streams = [self.__comment_stream__(group, skip_existing=True) for group in groups]
+        log.info("Streaming comments of %s subreddits." % (len(subs)))
+        last_save = time.time()
+        pause = 1
+        while True:
+            num_new = 0
+            for g, stream in enumerate(streams):
+                try:
+                    for c in stream:
+                        # None => no new comments in this stream right now
+                        if c is None:
+                            break
+                        sub = c.subreddit.display_name.lower()
+                        newest, newest_ids, _ = self.counter.high_water_mark(sub)
+                        if newest is not None and (c.created_utc < newest or c.name in newest_ids):
+                            # already counted before the stream was restarted
+                            continue
+                        mentioned = []
+                        if sub in general_subs:
+                            mentioned = [coin_subs[i] for i in matcher.match(c.body)]
+                        self.counter.add(sub, c.created_utc, c.name, mentioned, c.score)
+                        num_new += 1
+                except Exception as e:
+                    log.warning("Comment stream of %s failed, restarting it: %s" % ("+".join(groups[g]), str(e)))
+                    # the restarted stream returns the newest comments again, counted ones are skipped
+                    streams[g] = self.__comment_stream__(groups[g], skip_existing=False)
+            if time.time() - last_save > save_interval:
+                self.counter.prune(time.time())
+                self.counter.save()
+                last_save = time.time()
+            # praw does not wait between polls with pause_after=0
+            if num_new == 0:
+                time.sleep(pause)
+                pause = min(2 * pause, STREAM_MAX_PAUSE)
+            else:
+                pause = 1
+
+    def __comment_stream__(self, subs, skip_existing):
+        multireddit = self.reddit.subreddit("+".join(subs))
+        return multireddit.stream.comments(skip_existing=skip_existing, pause_after=0)
+
+    def __match__(self, coin_name_array, entries):
+        """
+        Returns the indices of the coins mentioned in each (item, kind) of entries
+        where kind is "comments" or "new" (submissions).
+        Matches are remembered for the rest of the cycle, new texts are matched
+        by self.mention_processes processes.
+        """
+        key = ("matches", tuple(tuple(coin) for coin in coin_name_array))
+        memo = self.__cached__(key, dict)
+        todo = [(item, kind) for item, kind in entries if item.name not in memo]
+        texts = [item.body if kind == "comments" else item.title for item, kind in todo]
+        for (item, _), matches in zip(todo, match_texts(coin_name_array, texts, self.mention_processes)):
+            memo[item.name] = matches
+        return [memo[item.name] for item, _ in entries]
+
     def get_mentions(self, coin_name_array, hours=None, include_submissions=True, score_scaling=True):
         """
         counts how often words from coin_name_tuple were mentioned in subreddits from subreddit list
@@ -106,56 +616,228 @@ class RedditStats(object):
         hour_ago = self.default_end - datetime.timedelta(hours=1)
         count_list = len(coin_name_array) * [0.]
         first_hour_list = len(coin_name_array) * [0.]
-        regex_list = []
-        for coin_name_tuple in coin_name_array:
-            pattern = r"\b|\b".join(coin_name_tuple)
-            pattern = r"\b"+pattern+r"\b"
-            regex_list.append(re.compile(pattern, re.I|re.UNICODE))
         comm_created = float('inf')
         submission_created = float('inf')
+        if self.counter is not None:
+            matcher = MentionMatcher(coin_name_array)
+            coin_subs = [coin[-1] for coin in coin_name_array]
+            coin_indices = {}
+            for i, coin_sub in enumerate(coin_subs):
+                coin_indices.setdefault(coin_sub, []).append(i)
+        # (item, kind) in the order in which they are counted
+        entries = []
+        for sub in GENERAL_SUBS:
+            if self.counter is not None:
+                # count mentions from the comment counter
+                try:
+                    covered_since = self.update_comment_counter(sub, start.timestamp(), matcher, coin_subs)
+                except:
+                    log.warn("Could not get mentions from subreddit: %s. It may be private or banned."
+                             % (sub))
+                    continue
+                covered_since = max(covered_since, start.timestamp())
+                comm_created = min(comm_created, covered_since)
+                end = self.default_end.timestamp()
+                for coin_sub, score in self.counter.mentions(sub, covered_since, end, score_scaling).items():
+                    for i in coin_indices.get(coin_sub, []):
+                        count_list[i] += score
+                for coin_sub, score in self.counter.mentions(sub, covered_since, hour_ago.timestamp(), score_scaling).items():
+                    for i in coin_indices.get(coin_sub, []):
+                        first_hour_list[i] += score
+            else:
+                try:
+                    comments = list(itertools.takewhile(lambda c: int(c.created_utc) >= int(start.timestamp()),
+                                                        self.get_comments(sub, limit=1024)))
+                except:
+                    log.warn("Could not get mentions from subreddit: %s. It may be private or banned."
+                             % (sub))
+                    continue
+                entries += [(c, "comments") for c in comments]
+            if include_submissions:
+                submissions = list(itertools.takewhile(lambda s: int(s.created_utc) >= int(start.timestamp()),
+                                                       self.get_new_submissions(sub)))
+                entries += [(s, "new") for s in submissions]
+        # match all texts at once (possibly in parallel) and count them in the serial order
+        for (item, kind), matches in zip(entries, self.__match__(coin_name_array, entries)):
+            if kind == "comments":
+                comm_created = min(comm_created, item.created_utc)
+            else:
+                submission_created = min(submission_created, item.created_utc)
+            weight = max(1, item.score*0.1) if score_scaling else 1
+            for i in matches:
+                count_list[i] += weight
+                if int(item.created) < int(hour_ago.timestamp()):
+                    first_hour_list[i] += weight
+        interval_length = self.default_end.timestamp() - min(comm_created, submission_created)
+        count_list = np.array(count_list) / (interval_length / HOUR_IN_SECONDS)
+        return (count_list, first_hour_list)
+
+    def get_hourly_activity(self, subreddit, hours=None):
+        """
+        Counts comments and submissions of subreddit per hour.
+        Hours which are not completely covered by the fetched listings are skipped for that column.
+
+        Returns:
+            Dict which maps the start of each hour (unix timestamp) to [comments, submissions]
+        """
+        if hours is None:
+            hours = self.hours
+        end = self.default_end.timestamp()
+        start = end - hours * HOUR_IN_SECONDS
+        comments = {}
+        if self.counter is not None:
+            covered_since = self.counter.covered_since(subreddit)
+            first_hour = int(start // HOUR_IN_SECONDS) * HOUR_IN_SECONDS
+            for hour in range(first_hour, int(end) + 1, HOUR_IN_SECONDS):
+                if covered_since is not None and hour >= covered_since:
+                    comments[hour] = self.counter.count(subreddit, hour - 1, min(hour + HOUR_IN_SECONDS - 1, end))
+        else:
+            comments = self.__listing_activity__(self.get_comments(subreddit, limit=1024), start, 1024)
+        submissions = self.__listing_activity__(self.get_new_submissions(subreddit), start, LISTING_PAGE_SIZE)
+        activity = {}
+        for hour, count in comments.items():
+            activity.setdefault(hour, [0, 0])[0] = count
+        for hour, count in submissions.items():
+            activity.setdefault(hour, [0, 0])[1] = count
+        return activity
+
+    def __window_items__(self, listing, start, limit):
+        """
+        Returns the items of listing created since start and the timestamp since which
+        they are complete (None if nothing is known to be complete).
+        """
+        items = []
+        covered_since = None
+        num_items = 0
+        for item in listing:
+            num_items += 1
+            if item.created_utc < start:
+                covered_since = start
+                break
+            items.append(item)
+            covered_since = item.created_utc
+        if num_items < limit or (listing.covered_since is not None and listing.covered_since <= start):
+            # the listing ended before the limit => there are no older items
+            covered_since = start
+        return items, covered_since
+
+    def __listing_activity__(self, listing, start, limit):
+        """
+        Counts the items of listing per hour, only hours since start which are completely covered are returned.
+        """
+        items, covered_since = self.__window_items__(listing, start, limit)
+        if covered_since is None:
+            return {}
+        counts = {}
+        for item in items:
+            if item.created_utc > self.default_end.timestamp():
+                continue
+            hour = int(item.created_utc // HOUR_IN_SECONDS) * HOUR_IN_SECONDS
+            counts[hour] = counts.get(hour, 0) + 1
+        return {hour: count for hour, count in counts.items() if hour >= covered_since}
+
+    def get_hourly_mentions(self, coin_name_array, hours=None):
+        """
+        Counts the mentions of every coin in GENERAL_SUBS per hour.
+        Only hours which are completely covered by the comments and submissions of all GENERAL_SUBS are returned.
+
+        Returns:
+            List with one dict per coin which maps the start of each hour (unix timestamp)
+            to [mentions, score scaled mentions]
+        """
+        if hours is None:
+            hours = self.hours
+        end = self.default_end.timestamp()
+        start = end - hours * HOUR_IN_SECONDS
+        first_hour = int(start // HOUR_IN_SECONDS) * HOUR_IN_SECONDS
+        coin_subs = [coin[-1] for coin in coin_name_array]
+        result = [{} for _ in coin_name_array]
+        entries = []
+        # timestamp since which the listings of all subreddits are complete
+        covered_since = start
         for sub in GENERAL_SUBS:
             try:
-                comments = self.reddit.subreddit(sub).comments(limit=1024)
+                if self.counter is not None:
+                    comments_covered_since = self.counter.covered_since(sub)
+                    if comments_covered_since is None:
+                        comments_covered_since = float("inf")
+                    for hour in range(first_hour, int(end) + 1, HOUR_IN_SECONDS):
+                        if hour < comments_covered_since:
+                            continue
+                        hour_end = min(hour + HOUR_IN_SECONDS - 1, end)
+                        counts = self.counter.mentions(sub, hour - 1, hour_end, score_scaling=False)
+                        scores = self.counter.mentions(sub, hour - 1, hour_end, score_scaling=True)
+                        for i, coin_sub in enumerate(coin_subs):
+                            if coin_sub in counts:
+                                mentions = result[i].setdefault(hour, [0, 0.])
+                                mentions[0] += counts[coin_sub]
+                                mentions[1] += scores[coin_sub]
+                    sub_entries = []
+                else:
+                    comments, comments_covered_since = self.__window_items__(self.get_comments(sub, limit=1024),
+                                                                             start, 1024)
+                    sub_entries = [(c, "comments") for c in comments]
+                submissions, submissions_covered_since = self.__window_items__(self.get_new_submissions(sub),
+                                                                               start, LISTING_PAGE_SIZE)
+                sub_entries += [(s, "new") for s in submissions]
             except:
                 log.warn("Could not get mentions from subreddit: %s. It may be private or banned."
                          % (sub))
                 continue
-            # search in comments
-            for comm in comments:
-                if int(comm.created_utc) < int(start.timestamp()):
-                    break
-                comm_created = min(comm_created, comm.created_utc)
-                for i, regex in enumerate(regex_list):
-                    if not re.search(regex, comm.body) is None:
-                        if score_scaling:
-                            count_list[i] += max(1, comm.score*0.1)
-                        else:
-                            count_list[i] += 1
-                        if int(comm.created) < int(hour_ago.timestamp()):
-                            if score_scaling:
-                                first_hour_list[i] += max(1, comm.score*0.1)
-                            else:
-                                first_hour_list[i] += 1
-            # search in submissions
-            if include_submissions:
-                for submission in self.reddit.subreddit(sub).new():
-                    if int(submission.created_utc) < int(start.timestamp()):
-                        break
-                    submission_created = min(submission_created, submission.created_utc)
-                    for i, regex in enumerate(regex_list):
-                        if not re.search(regex, submission.title) is None:
-                            if score_scaling:
-                                count_list[i] += max(1, comm.score*0.1)
-                            else:
-                                count_list[i] += 1
-                            if int(submission.created) < int(hour_ago.timestamp()):
-                                if score_scaling:
-                                    first_hour_list[i] += max(1, comm.score*0.1)
-                                else:
-                                    first_hour_list[i] += 1
-        interval_length = self.default_end.timestamp() - min(comm_created, submission_created)
-        count_list = np.array(count_list) / (interval_length / HOUR_IN_SECONDS)
-        return (count_list, first_hour_list)
+            entries += sub_entries
+            for sub_covered_since in (comments_covered_since, submissions_covered_since):
+                covered_since = max(covered_since, float("inf") if sub_covered_since is None else sub_covered_since)
+        for (item, _), matches in zip(entries, self.__match__(coin_name_array, entries)):
+            if item.created_utc > end:
+                continue
+            hour = int(item.created_utc // HOUR_IN_SECONDS) * HOUR_IN_SECONDS
+            for i in matches:
+                mentions = result[i].setdefault(hour, [0, 0.])
+                mentions[0] += 1
+                mentions[1] += max(1, item.score*0.1)
+        # a partially covered hour would be stored with too few mentions
+        return [{hour: mentions for hour, mentions in coin_mentions.items() if hour >= covered_since}
+                for coin_mentions in result]
+
+    def collect_cycle(self, coin_name_array, hours=None, workers=1):
+        """
+        Collects the stats of all coins in coin_name_array for the current cycle.
+        If workers > 1 the subreddits are collected concurrently.
+
+        Returns:
+            Tuple (stats_dicts, activity_dicts) for insert_data_many and insert_activity_many.
+        """
+        if hours is None:
+            hours = self.hours
+        mentions = self.get_mentions(coin_name_array, hours=hours,
+                                     include_submissions=True, score_scaling=True)
+        log.info("Got mentions for all subs.")
+        hourly_mentions = self.get_hourly_mentions(coin_name_array, hours=hours)
+        coin_subs = [coin[-1] for coin in coin_name_array]
+        self.prefetch_subscribers(coin_subs)
+        self.prefetch_listings(coin_subs, self.default_end.timestamp() - hours * HOUR_IN_SECONDS, workers=workers)
+
+        def compile_stats(i):
+            subreddit = coin_name_array[i][-1]
+            stats_dict = self.compile_dict(subreddit, hours=hours)
+            stats_dict["mention_rate"] = mentions[0][i]
+            stats_dict["mention_rate_1h"] = mentions[1][i]
+            try:
+                hourly_activity = self.get_hourly_activity(subreddit, hours=hours)
+            except:
+                log.warn("Could not get hourly activity for subreddit: %s." % (subreddit))
+                hourly_activity = {}
+            log.info("Got stats for: %s" % (subreddit))
+            return stats_dict, hourly_activity
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(compile_stats, range(len(coin_name_array))))
+        else:
+            results = [compile_stats(i) for i in range(len(coin_name_array))]
+        stats_dicts = [r[0] for r in results]
+        activity_dicts = activity.collect_activity_dicts(coin_name_array, [r[1] for r in results], hourly_mentions)
+        return stats_dicts, activity_dicts
 
     def compile_dict(self, subreddit, hours=None):
         if hours is None:
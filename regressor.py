@@ -14,6 +14,7 @@ from numpy import dot
 from numpy.linalg import inv
 
 import util
+from training_data import TrainingDataStore
 
 
 # 3D plotting
@@ -88,7 +89,8 @@ def cross_validation(k, data, values, lambda_):
 # a)
 # data = np.loadtxt("dataLinReg2D.txt")
 # b)
-data = np.loadtxt("data.csv", delimiter=",")
+# data = np.loadtxt("data.csv", delimiter=",")
+coins, end_times, data = TrainingDataStore().load()
 
 print("data.shape:", data.shape)
 # np.savetxt("tmp.txt", data)  # save data if you want to
@@ -0,0 +1,114 @@
+import collections
+import json
+import os
+import threading
+import time
+
+import util
+
+log = util.setup_logger(__name__)
+
+# number of durations kept per job
+HISTORY_LENGTH = 100
+
+
+class Job(object):
+    """
+    Calls func every interval seconds in its own long-lived thread,
+    so runs of the same job never overlap and thread local connections stay open.
+    Runs which were due while the previous run was still going are skipped.
+    """
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.durations = collections.deque(maxlen=HISTORY_LENGTH)
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_start = None
+        self.thread = None
+
+    def stats(self):
+        durations = list(self.durations)
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_start": self.last_start,
+            "last_duration": durations[-1] if len(durations) > 0 else None,
+            "mean_duration": sum(durations) / len(durations) if len(durations) > 0 else None,
+            "max_duration": max(durations) if len(durations) > 0 else None,
+        }
+
+
+class Scheduler(object):
+    """
+    Runs jobs on their intervals until stop is called and records the duration of every run.
+    The stats of all jobs are written to stats_file (if given) after every run.
+    """
+
+    def __init__(self, jobs, stats_file=None):
+        self.jobs = jobs
+        self.stats_file = stats_file
+        self.stop_event = threading.Event()
+        self.stats_lock = threading.Lock()
+
+    def __loop__(self, job):
+        next_run = time.time()
+        while not self.stop_event.is_set():
+            job.last_start = time.time()
+            try:
+                job.func()
+            except Exception:
+                job.failures += 1
+                log.exception("Job %s failed." % (job.name))
+            duration = time.time() - job.last_start
+            job.runs += 1
+            job.durations.append(duration)
+            log.info("Job %s took %.1fs." % (job.name, duration))
+            next_run += job.interval
+            now = time.time()
+            if next_run < now:
+                missed = int((now - next_run) // job.interval) + 1
+                job.skipped += missed
+                next_run += missed * job.interval
+                log.warn("Job %s took longer than its interval, skipped %s runs." % (job.name, missed))
+            self.__save_stats__()
+            self.stop_event.wait(next_run - time.time())
+
+    def __save_stats__(self):
+        if self.stats_file is None:
+            return
+        with self.stats_lock:
+            stats = {job.name: job.stats() for job in self.jobs}
+            tmp_path = self.stats_file + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp_path, self.stats_file)
+
+    def start(self):
+        for job in self.jobs:
+            job.thread = threading.Thread(target=self.__loop__, args=(job,), name=job.name, daemon=True)
+            job.thread.start()
+            log.info("Scheduled %s every %ss." % (job.name, job.interval))
+
+    def run(self):
+        """
+        Starts all jobs and blocks until interrupted.
+        """
+        self.start()
+        try:
+            while not self.stop_event.is_set():
+                self.stop_event.wait(1)
+        except KeyboardInterrupt:
+            log.info("Stopping after the running jobs finish.")
+        self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for job in self.jobs:
+            if job.thread is not None:
+                job.thread.join()
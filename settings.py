@@ -11,13 +11,75 @@ general = dict(
     bittrex_file=os.path.join(csvdir, "bittrex.csv"),
     log_file=os.path.join(filedir, "log.log"),
     auth_file=os.path.join(filedir, "auth.json"),
+    training_data_dir=os.path.join(filedir, "training_data"),
+    comment_counter_file=os.path.join(filedir, "comment_counter.json"),
+    archive_dir=os.path.join(filedir, "archive"),
+)
+
+#postgres settings
+postgres = dict(
+    min_connections=1,
+    max_connections=8,
+    # rows per round trip for streaming server-side cursors
+    itersize=2000
 )
 
 #reddit settings
 reddit = dict(
     general_subs=["cryptocurrency", "cryptotrading",
                   "cryptotrade", "cryptomarkets",
-                  "cryptowallstreet", "altcoin"]
+                  "cryptowallstreet", "altcoin"],
+    # request budget shared by all workers of a concurrent collection
+    requests_per_minute=60,
+    # only fetch comments newer than the last cycle (see comment_counter.py)
+    incremental_comments=False,
+    # keep the downloaded comments and submissions of the general subs in archive_dir
+    archive_texts=False,
+    # hours after which archived cycles are deleted
+    archive_retention_hours=24*7,
+    # processes matching coin mentions in the general subs (None: all cores)
+    mention_processes=1,
+    # fetch the listings of this many coin subreddits as one multireddit (0: fetch every subreddit separately)
+    multireddit_group_size=0,
+    # fetch listings as raw JSON and keep only the used fields (see reddit.LeanListing)
+    lean_listings=False
+)
+
+#growth feature settings
+growth_features = dict(
+    # growth windows (in hours) which are materialized after every collection
+    windows=[12, 24],
+    # how many hours are computed at most when the table is empty or was not updated for a while
+    backfill_hours=48,
+    # read growths from the materialized growth table instead of the raw data (see query.growth_at)
+    use_materialized=False,
+    # take the submission, comment and mention rates of the growth rate features from the activity table
+    # (see activity.ActivityHistogram) instead of interpolating the data rows
+    activity_rates=False,
+    # window (in hours) of those rates, the hours of main.collect
+    activity_rate_hours=12
+)
+
+#coinmarketcap settings
+coincap = dict(
+    # v1 ticker endpoint (e.g. of a local fake_coincap.py server)
+    url="https://api.coinmarketcap.com/v1/ticker/",
+    # number of top coins fetched for the price data
+    price_limit=1000,
+    # seconds for which ticker responses are reused
+    ttl=60,
+    # json file which keeps the responses across processes (None: memory only)
+    cache_file=None
+)
+
+#daemon settings (main.py --daemon)
+daemon = dict(
+    # seconds between the starts of two runs of a job (0: disabled)
+    collect_interval=3600,
+    collect_price_interval=600,
+    auto_trade_interval=3600,
+    # json file with the run durations of every job
+    stats_file=os.path.join(filedir, "daemon_stats.json")
 )
 
 #simulator settings
@@ -3,11 +3,10 @@ from __future__ import division
 from __future__ import print_function
 
 
-from database import DatabaseConnection
+import database
 import numpy as np
 import argparse
 import datetime
-import util
 
 
 def calc_mean_growth(features_old, features_new):
@@ -42,8 +41,7 @@ def main():
     parser.add_argument('hours', metavar='h', type=float)
     args = parser.parse_args()
 
-    auth = util.get_postgres_auth()
-    db = DatabaseConnection(**auth)
+    db = database.get_shared_connection()
 
     cur_utc = datetime.datetime.utcnow()
     subreddits = db.get_subreddits_with_data(cur_utc-datetime.timedelta(hours=args.hours))
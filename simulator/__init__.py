@@ -63,8 +63,7 @@ def simulate(policy_list, start_time, end_time=datetime.datetime.utcnow()):
     """
     Function which sets up and runs the simulator.
     """
-    auth = util.get_postgres_auth()
-    db = database.DatabaseConnection(**auth)
+    db = database.get_shared_connection()
     avg_percentage_gains = {}
     color_dict = {
         "subreddit_growth_policy": "b",
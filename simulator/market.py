@@ -110,11 +110,13 @@ class Market(object):
         """
         Returns the current total value of the portfolio.
         """
+        owned = self.owned_coins()
+        if len(owned) == 0:
+            return 0.0
+        prices = self.db.get_interpolated_price_series(owned.keys(), [self.simulator.time])
         total_value = 0.0
-        for coin, balance in self.portfolio.items():
-            if balance > 0:
-                current_value = self.db.get_interpolated_price_data(coin, self.simulator.time)[0]
-                total_value += current_value * balance
+        for coin, balance in owned.items():
+            total_value += prices[coin][0, 0] * balance
         return total_value
 
     def create_binance_market(db):
@@ -7,6 +7,8 @@ import query
 import settings
 import util
 
+log = util.setup_logger(__name__)
+
 SCALE_SPENDINGS = settings.simulator["scale_spendings"]
 K = settings.simulator["k"]
 STEP_HOURS = settings.simulator["step_hours"]
@@ -44,7 +46,7 @@ def largest_24h_increase_policy(self, time, step_nr):
             gain = self.db.get_interpolated_price_data(coin, time)
         except ValueError:
             continue
-        if gain == [] or gain is None:
+        if gain is None:
             continue
         gains.append([coin, gain[2]])
     gains = sorted(gains, key=lambda subr: subr[1])
@@ -105,9 +107,7 @@ def subreddit_growth_policy(self, time, step_nr):
         self.all_subs = self.market.portfolio.keys()
     else:
         self.market.sell_all()
-    start_time = time - datetime.timedelta(hours=GROWTH_HOURS)
-    end_time = time
-    growths = query.average_growth(self.db, self.all_subs, start_time, end_time)
+    growths = query.growth_at(self.db, self.all_subs, time, GROWTH_HOURS)
     growths.reverse()
 
     if SCALE_SPENDINGS:
@@ -138,8 +138,7 @@ def hybrid_policy(self, time, step_nr):
     else:
         self.market.sell_all()
     start_time = time - datetime.timedelta(hours=GROWTH_HOURS)
-    end_time = time
-    growths = query.average_growth(self.db, self.all_subs, start_time, end_time)
+    growths = query.growth_at(self.db, self.all_subs, time, GROWTH_HOURS)
     # convert to percentages
     for g in growths:
         g[1] = g[1]*100. - 100.
@@ -196,9 +195,7 @@ def subreddit_growth_policy_with_stagnation_detection(self, time, step_nr):
         earliest_sell = min(self.bought_time.values()) + datetime.timedelta(hours=STEP_HOURS) - time
         earliest_sell = max(earliest_sell, datetime.timedelta(hours=2))
         return earliest_sell
-    start_time = time - datetime.timedelta(hours=GROWTH_HOURS)
-    end_time = time
-    growths = query.average_growth(self.db, self.all_subs, start_time, end_time)
+    growths = query.growth_at(self.db, self.all_subs, time, GROWTH_HOURS)
     growths.reverse()
 
     if SCALE_SPENDINGS:
@@ -258,9 +255,7 @@ def subreddit_growth_policy_with_dynamic_stagnation_detection(self, time, step_n
         earliest_sell = min(self.bought_time.values()) + datetime.timedelta(hours=STEP_HOURS) - time
         earliest_sell = max(earliest_sell, datetime.timedelta(hours=2))
         return earliest_sell
-    start_time = time - datetime.timedelta(hours=GROWTH_HOURS)
-    end_time = time
-    growths = query.average_growth(self.db, self.all_subs, start_time, end_time)
+    growths = query.growth_at(self.db, self.all_subs, time, GROWTH_HOURS)
     growths.reverse()
 
     if SCALE_SPENDINGS:
@@ -296,22 +291,11 @@ def subreddit_growth_policy_with_dynamic_stagnation_detection(self, time, step_n
 # ------------------helper functions ---------------------
 def __stagnation_detection__(db, time, subreddit):
     start_time = time - datetime.timedelta(hours=STAGNATION_HOURS)
-    price_data = db.get_all_price_data_in_interval(start_time, time)
-    price_now = 0
-    price_xhrs_ago = 0
-    for line in price_data:
-        if line[0] == subreddit:
-            price_now = line[1]
-            break
-    for line in reversed(price_data):
-        if line[0] == subreddit:
-            price_xhrs_ago = line[1]
-            break
-    if price_now == 0 or price_xhrs_ago == 0:
+    subs, changes = query.price_changes(db, start_time, time, [subreddit])
+    if len(subs) == 0 or changes[0] == float('inf'):
         log.warn("No price data for %s. Assuming no stagnation." % (subreddit))
         return False
-    price_change = (price_now - price_xhrs_ago) / price_xhrs_ago
-    if price_change < STAGNATION_THRESHOLD:
+    if changes[0] < STAGNATION_THRESHOLD:
         return True
     return False
 
@@ -321,30 +305,5 @@ def __dynamic_stagnation_detection__(db, time, subreddit_list):
     gainers in the last STAGNATION_HOURS hours.
     """
     start_time = time - datetime.timedelta(hours=STAGNATION_HOURS)
-    price_data = db.get_all_price_data_in_interval(start_time, time)
-    all_subs = []
-    price_changes = []
-    for line in price_data:
-        if not line[0] in all_subs:
-            all_subs.append(line[0])
-    for subreddit in all_subs:
-        price_now = 0
-        price_xhrs_ago = 0
-        for line in price_data:
-            if line[0] == subreddit:
-                price_now = line[1]
-                break
-        for line in reversed(price_data):
-            if line[0] == subreddit:
-                price_xhrs_ago = line[1]
-                break
-        if price_now == 0 or price_xhrs_ago == 0:
-            log.warn("No price data for %s. Assuming no stagnation." % (subreddit))
-            price_change = float('inf')
-        else:
-            price_change = (price_now - price_xhrs_ago) / price_xhrs_ago
-        price_changes.append((subreddit, price_change))
-    price_changes = sorted(price_changes, key=lambda subr: subr[1])
-    price_changes.reverse()
-    top_gainers = [c[0] for c in price_changes[:DYNAMIC_TOP_NR] ]
+    top_gainers = query.top_price_gainers(db, start_time, time, DYNAMIC_TOP_NR)
     return [s for s in subreddit_list if s in top_gainers]
@@ -0,0 +1,106 @@
+import datetime
+
+import numpy as np
+
+import query
+from activity import ActivityHistogram, collect_activity_dicts
+from fake_reddit import FakeItem, FakeReddit
+from reddit import HOUR_IN_SECONDS, RedditStats
+from settings import growth_features
+
+# a full hour, so that the window of the stats starts at an hour boundary
+NOW = 1514764800
+COINS = [["bitcoin", "Bitcoin", "BTC", "bitcoin"]]
+
+
+def stats_for(fake):
+    stat = RedditStats(hours=4, reddit_factory=lambda: fake, mention_processes=1)
+    stat.default_end = datetime.datetime.fromtimestamp(NOW)
+    stat.default_start = stat.default_end - datetime.timedelta(hours=4)
+    return stat
+
+
+def test_hourly_mentions_skip_partially_covered_hours():
+    fake = FakeReddit.from_records([], now=NOW)
+    # 1100 comments 10s apart => the 1024 newest reach back 2h50m, the window is 4h
+    fake.listings[("altcoin", "comments")] = [
+        FakeItem("t1_{}".format(i), "altcoin", NOW - 5 - 10 * i, 1, "I bought bitcoin", "comments")
+        for i in range(1100)]
+    mentions = stats_for(fake).get_hourly_mentions(COINS)[0]
+    assert sorted(mentions) == [NOW - 2 * HOUR_IN_SECONDS, NOW - HOUR_IN_SECONDS]
+    assert mentions[NOW - HOUR_IN_SECONDS] == [360, 360.]
+
+
+def test_hourly_mentions_and_activity_of_covered_listings():
+    fake = FakeReddit.from_records([], now=NOW)
+    fake.listings[("altcoin", "comments")] = [
+        FakeItem("t1_{}".format(i), "altcoin", NOW - 5 - 1800 * i, 50, "bitcoin to the moon", "comments")
+        for i in range(10)]
+    fake.listings[("bitcoin", "new")] = [
+        FakeItem("t3_{}".format(i), "bitcoin", NOW - 5 - 3600 * i, 1, "news", "new") for i in range(3)]
+    stat = stats_for(fake)
+    mentions = stat.get_hourly_mentions(COINS)
+    activity = stat.get_hourly_activity("bitcoin")
+    assert sorted(mentions[0]) == [NOW - h * HOUR_IN_SECONDS for h in (4, 3, 2, 1)]
+    assert mentions[0][NOW - HOUR_IN_SECONDS] == [2, 10.]
+    assert activity == {NOW - h * HOUR_IN_SECONDS: [0, 1] for h in (3, 2, 1)}
+
+    rows = collect_activity_dicts(COINS, [activity], mentions)
+    by_hour = {row["hour"]: row for row in rows}
+    row = by_hour[datetime.datetime.utcfromtimestamp(NOW - HOUR_IN_SECONDS)]
+    assert (row["comments"], row["submissions"], row["mentions"], row["mention_score"]) == (0, 1, 2, 10.)
+    assert by_hour[datetime.datetime.utcfromtimestamp(NOW - 4 * HOUR_IN_SECONDS)]["submissions"] == 0
+
+
+H0 = datetime.datetime(2018, 1, 1)
+HOUR = datetime.timedelta(hours=1)
+
+
+class FakeActivityDb(object):
+    """
+    In-memory activity table and interpolated data with constant rates.
+    """
+
+    def __init__(self, rows):
+        # rows of (subreddit, hour, comments, submissions, mentions, mention_score)
+        self.rows = rows
+
+    def get_activity(self, subreddits, start, end):
+        return [row for row in self.rows if row[0] in subreddits and start <= row[1] < end]
+
+    def get_interpolated_series(self, subreddit, timestamps):
+        return np.array([[1000. + i, 50., 50., 50., 0., 0., 0.] for i in range(len(timestamps))])
+
+
+def activity_db():
+    # bitcoin has activity from H0 on, h comments in hour h
+    return FakeActivityDb([("bitcoin", H0 + h * HOUR, h, 1, 2, 3.) for h in range(30)])
+
+
+def test_histogram_window_rates():
+    histogram = ActivityHistogram(activity_db(), ["bitcoin", "ethereum"], H0, H0 + 30 * HOUR)
+    rates = histogram.window_rates("bitcoin", [H0 + 12 * HOUR, H0 + 20.5 * HOUR, H0 + 5 * HOUR], 12)
+    assert np.allclose(rates[:2], [[5.5, 1, 2, 3], [13.5, 1, 2, 3]])
+    # the window starts before the first stored hour
+    assert np.isnan(rates[2]).all()
+    assert np.isnan(histogram.window_rates("ethereum", [H0 + 20 * HOUR], 12)).all()
+    assert np.allclose(histogram.get_rates("bitcoin", H0 + 12 * HOUR, H0 + 20.5 * HOUR), histogram.window_rates(
+        "bitcoin", [H0 + 20 * HOUR], 8)[0])
+    assert np.allclose(histogram.totals(H0, H0 + 2 * HOUR), [[1, 2, 4, 6.], [0, 0, 0, 0.]])
+
+
+def test_growth_rates_from_the_activity_table(monkeypatch):
+    db = activity_db()
+    start, end = H0 + 6 * HOUR, H0 + 29 * HOUR
+    interpolated = query.averaged_interval_growth_rate(db, "bitcoin", start, end)
+    monkeypatch.setitem(growth_features, "activity_rates", True)
+    monkeypatch.setitem(growth_features, "activity_rate_hours", 12)
+    counted = query.averaged_interval_growth_rate(db, "bitcoin", start, end)
+    time_list, total_hours = query.interval_time_list(start, end)
+    metrics = db.get_interpolated_series("bitcoin", time_list)
+    for i, t in enumerate(time_list):
+        if t >= H0 + 12 * HOUR:
+            comments = np.mean(range(int((t - H0) / HOUR) - 12, int((t - H0) / HOUR)))
+            metrics[i, 1:4] = [1, comments, 3.]
+    assert np.allclose(counted, query.growth_rate_from_metrics(metrics, total_hours))
+    assert interpolated[0] == counted[0] and not np.allclose(interpolated[1:], counted[1:])
@@ -0,0 +1,83 @@
+import datetime
+import os
+
+import numpy as np
+
+import settings
+
+from archive import TextArchive, recompute_mentions
+from fake_reddit import FakeReddit, synthetic_coin_name_array
+from reddit import RedditStats
+
+
+def record(fullname, created_utc, score=1, subreddit="altcoin", text="text"):
+    return {"id": fullname, "subreddit": subreddit, "kind": "comments",
+            "created_utc": created_utc, "created": created_utc, "score": score, "text": text}
+
+
+def test_read_returns_latest_version_newest_first(tmp_path):
+    archive = TextArchive(str(tmp_path))
+    archive.append([record("t1_a", 100, score=1), record("t1_b", 200)], datetime.datetime(2018, 1, 1, 1))
+    archive.append([record("t1_a", 100, score=5)], datetime.datetime(2018, 1, 1, 2))
+    records = TextArchive(str(tmp_path)).read(0, 1000)
+    assert [r["id"] for r in records] == ["t1_b", "t1_a"]
+    assert records[1]["score"] == 5
+    assert archive.read(150, 1000, subreddits=["other"]) == []
+
+
+def test_covers_joins_the_coverage_of_segments(tmp_path):
+    archive = TextArchive(str(tmp_path))
+    first = datetime.datetime(2018, 1, 1, 10)
+    second = first + datetime.timedelta(hours=1)
+    archive.append([record("t1_a", first.timestamp() - 10)], first,
+                   {"altcoin/comments": first.timestamp() - 3600})
+    archive.append([record("t1_b", second.timestamp() - 10)], second,
+                   {"altcoin/comments": first.timestamp() - 60})
+    subs = ["altcoin"]
+    assert archive.covers(first.timestamp() - 3600, second.timestamp(), subs, kinds=["comments"])
+    assert not archive.covers(first.timestamp() - 7200, second.timestamp(), subs, kinds=["comments"])
+    assert not archive.covers(first.timestamp() - 3600, second.timestamp() + 1, subs, kinds=["comments"])
+    assert not archive.covers(first.timestamp() - 3600, second.timestamp(), subs, kinds=["new"])
+
+
+def test_recompute_matches_live_mention_rates(tmp_path):
+    coins = synthetic_coin_name_array(40)
+    stat = RedditStats(hours=2, reddit_factory=lambda: fake, mention_processes=1)
+    fake = FakeReddit(coins, now=stat.default_end.timestamp())
+    live = stat.get_mentions(coins, hours=2)
+    archive = TextArchive(str(tmp_path))
+    archive.append(stat.get_archive_records(), stat.default_end, stat.get_archive_coverage())
+
+    earlier = stat.default_end - datetime.timedelta(hours=1)
+    result = recompute_mentions(coins, [earlier, stat.default_end], hours=2, archive=archive, processes=1)
+    # the window of the earlier cycle starts before the archived listings
+    assert result[0] is None
+    count_list, first_hour_list = result[1]
+    assert np.allclose(count_list, live[0])
+    assert np.allclose(first_hour_list, live[1])
+    assert sum(first_hour_list) > 0
+
+
+def test_prune_deletes_old_cycles(tmp_path):
+    archive = TextArchive(str(tmp_path))
+    first = datetime.datetime(2018, 1, 1, 10)
+    for h in range(3):
+        archive.append([record("t1_{}".format(h), first.timestamp() + h * 3600 - 10)],
+                       first + datetime.timedelta(hours=h))
+    archive.prune(first + datetime.timedelta(hours=1))
+    reloaded = TextArchive(str(tmp_path))
+    assert [r["id"] for r in reloaded.read(0, first.timestamp() + 7200)] == ["t1_2", "t1_1"]
+    assert sorted(os.listdir(str(tmp_path))) == sorted(list(reloaded.index) + ["index.json"])
+
+
+def test_archive_records_of_the_general_subs_only():
+    coins = synthetic_coin_name_array(5)
+    stat = RedditStats(hours=2, reddit_factory=lambda: fake, mention_processes=1)
+    fake = FakeReddit(coins, now=stat.default_end.timestamp())
+    stat.get_mentions(coins, hours=2)
+    stat.get_num_comments_per_hour(coins[0][-1], hours=2)
+    general_subs = settings.reddit["general_subs"]
+    records = stat.get_archive_records(general_subs)
+    assert len(records) > 0 and set(r["subreddit"] for r in records) <= set(general_subs)
+    assert len(stat.get_archive_records()) > len(records)
+    assert set(key.split("/")[0] for key in stat.get_archive_coverage(general_subs)) <= set(general_subs)
@@ -0,0 +1,65 @@
+import os
+
+import coin_registry
+import util
+from coin_registry import CoinRegistry
+
+COINS = [
+    ["bitcoin", "Bitcoin", "BTC", "bitcoin"],
+    ["ethereum", "Ethereum", "ETH", "ethereum"],
+    ["bitcoin-cash", "Bitcoin Cash", "BCH", "btc"],
+    ["bcash-fork", "BCash", "BCH", "bitcoincash"],
+]
+
+
+def test_lookups_match_the_util_helpers():
+    registry = CoinRegistry(COINS)
+    assert len(registry) == 4 and registry[1] == tuple(COINS[1])
+    for coin in COINS:
+        assert registry.symbol_for_sub(coin[-1]) == util.get_symbol_for_sub(COINS, coin[-1])
+        assert registry.subs_for_symbol(coin[-2]) == util.get_subs_for_symbol(COINS, coin[-2])
+        assert list(registry.coin_for_symbol(coin[-2])) == util.get_coin_from_symbol(COINS, coin[-2])
+        assert registry.coin_for_id(coin[0]) == tuple(coin)
+    assert registry.symbol_for_sub("dogecoin") is None
+    assert registry.subs_for_symbol("DOGE") == []
+    assert not registry.has_symbol("DOGE") and registry.has_symbol("BCH")
+    assert registry.coins_for_alias("bch") == [tuple(COINS[2]), tuple(COINS[3])]
+    assert util.known_subs_for_symbols(registry, ["BCH", "DOGE", "ETH"]) == (["DOGE"], ["btc", "ethereum"])
+
+
+def test_as_registry_does_not_rebuild_registries():
+    registry = CoinRegistry(COINS)
+    assert coin_registry.as_registry(registry) is registry
+    assert coin_registry.as_registry(COINS).coins == registry.coins
+
+
+def test_merge_keeps_first_array_and_adds_new_symbols():
+    merged = util.merge_coin_arrays(COINS[:2], [["bitcoin", "Bitcoin", "BTC", "btc"], ["ripple", "Ripple", "XRP", "ripple"]])
+    assert merged == COINS[:2] + [["ripple", "Ripple", "XRP", "ripple"]]
+
+
+def test_load_rereads_only_modified_files(tmp_path):
+    path = str(tmp_path / "coins.csv")
+    with open(path, "w") as f:
+        f.write("\n".join(",".join(coin) for coin in COINS[:2]) + "\n")
+    first = coin_registry.load(path)
+    assert coin_registry.load(path) is first
+    with open(path, "a") as f:
+        f.write(",".join(COINS[2]) + "\n")
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    second = coin_registry.load(path)
+    assert second is not first and len(second) == 3
+
+
+def test_util_helpers_delegate_to_registries(monkeypatch):
+    registry = CoinRegistry(COINS)
+    for coin in COINS:
+        assert util.get_symbol_for_sub(registry, coin[-1]) == util.get_symbol_for_sub(COINS, coin[-1])
+        assert util.get_subs_for_symbol(registry, coin[-2]) == util.get_subs_for_symbol(COINS, coin[-2])
+        assert list(util.get_coin_from_symbol(registry, coin[-2])) == util.get_coin_from_symbol(COINS, coin[-2])
+    # a registry is never scanned
+    monkeypatch.setattr(CoinRegistry, "__iter__", lambda self: iter(()))
+    assert util.get_symbol_for_sub(registry, "btc") == "BCH"
+    assert util.get_subs_for_symbol(registry, "BCH") == ["btc", "bitcoincash"]
+    assert util.get_coin_from_symbol(registry, "ETH") == tuple(COINS[1])
+    assert util.known_subs_for_symbols(registry, ["BCH", "DOGE", "ETH"]) == (["DOGE"], ["btc", "ethereum"])
@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+import requests
+
+import coinmarketcap
+from coinmarketcap import CoinCap, api_coin_index, normalize_id
+from fake_coincap import FakeTickerServer
+from fake_reddit import synthetic_coin_name_array
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(coinmarketcap, "response_cache", {})
+
+
+def test_index_keeps_the_first_entry_of_every_alias():
+    data = [{"id": "bitcoin-cash", "name": "Bitcoin Cash"},
+            {"id": "bitcoincash", "name": "Bitcoin"},
+            {"id": "bitcoin", "name": "Bitcoin"}]
+    assert normalize_id("Bitcoin-Cash") == "bitcoincash"
+    index = api_coin_index(data, [normalize_id(coin["id"]) for coin in data])
+    assert index == {"bitcoincash": 0, "bitcoin-cash": 0, "Bitcoin Cash": 0, "Bitcoin": 1, "bitcoin": 2}
+
+
+def test_price_dicts_match_the_coin_name_array():
+    coins = synthetic_coin_name_array(12)
+    # matched by name only, and a coin the ticker does not know
+    coins[3] = ["renamed", "Fakecoin3", "FK3", "fakecoin3"]
+    coins.append(["missing", "Missing", "MIS", "missingcoin"])
+    now = datetime.datetime(2018, 1, 1)
+    with FakeTickerServer(20) as server:
+        price_dicts = CoinCap(url=server.url, limit=10, ttl=60).get_price_dicts(coins, now)
+        ticker = server.ticker
+    by_sub = dict((d["subreddit"], d) for d in price_dicts)
+    assert sorted(by_sub) == sorted(coin[-1] for coin in coins[:10])
+    assert by_sub["fakecoin3"]["coin_id"] == "fakecoin-3"
+    for i in range(10):
+        d = by_sub["fakecoin{}".format(i)]
+        assert (d["price"], d["symbol"], d["time"]) == (ticker[i]["price_usd"], "FK{}".format(i), now)
+
+
+def test_responses_are_reused_within_the_ttl(tmp_path):
+    cache_file = str(tmp_path / "coincap.json")
+    with FakeTickerServer(20) as server:
+        url = server.url
+        first = CoinCap(url=url, limit=20, ttl=60, cache_file=cache_file).get_coin_names(20)
+    # the server is gone, a smaller ticker is cut from the cached one
+    assert CoinCap(url=url, ttl=60).get_coin_names(5) == first[:5]
+    with pytest.raises(requests.exceptions.RequestException):
+        CoinCap(url=url, ttl=60).get_coin_names(30)
+    # another process only has the cache file
+    coinmarketcap.response_cache.clear()
+    assert CoinCap(url=url, ttl=60, cache_file=cache_file).get_coin_names(20) == first
+    coinmarketcap.response_cache.clear()
+    with pytest.raises(requests.exceptions.RequestException):
+        CoinCap(url=url, ttl=0, cache_file=cache_file).get_coin_names(20)
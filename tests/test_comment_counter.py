@@ -0,0 +1,134 @@
+import datetime
+
+import pytest
+
+from comment_counter import CommentCounter
+from fake_reddit import FakeItem, FakeReddit, FakeSubreddit
+from reddit import RedditStats
+
+NOW = 1514764800
+
+
+def comment(fullname, created_utc, subreddit="altcoin"):
+    return FakeItem(fullname, subreddit, created_utc, 1, "text", "comments")
+
+
+def stats_for(fake, counter):
+    return RedditStats(hours=2, counter=counter, reddit_factory=lambda: fake, mention_processes=1)
+
+
+def test_counts_buckets_mentions_and_reloads(tmp_path):
+    counter = CommentCounter(str(tmp_path / "counter.json"))
+    counter.add("AltCoin", NOW - 30, "t1_a", ["bitcoin"], score=50)
+    counter.add("altcoin", NOW - 90, "t1_b")
+    assert counter.count("altcoin", NOW - 120, NOW) == 1
+    assert counter.count("altcoin", NOW - 200, NOW) == 2
+    assert counter.mentions("altcoin", NOW - 200, NOW) == {"bitcoin": 5.}
+    assert counter.mentions("altcoin", NOW - 200, NOW, score_scaling=False) == {"bitcoin": 1}
+    counter.save()
+    reloaded = CommentCounter(str(tmp_path / "counter.json"))
+    assert reloaded.high_water_mark("altcoin")[:2] == (NOW - 30, ["t1_a"])
+    reloaded.prune(NOW + 48 * 3600 - 60)
+    assert reloaded.count("altcoin", NOW - 200, NOW) == 1
+
+
+def test_update_counts_comments_created_in_the_second_of_the_mark(tmp_path):
+    fake = FakeReddit.from_records([], now=NOW)
+    fake.listings[("altcoin", "comments")] = [comment("t1_b", NOW - 100), comment("t1_a", NOW - 200)]
+    counter = CommentCounter(str(tmp_path / "counter.json"))
+    stat = stats_for(fake, counter)
+    assert stat.update_comment_counter("altcoin", NOW - 3600) == NOW - 3600
+    assert counter.count("altcoin", NOW - 3600, NOW) == 2
+
+    # a second comment in the same second as the high-water mark arrives after the update
+    fake.listings[("altcoin", "comments")].insert(0, comment("t1_c", NOW - 100))
+    stat.new_cycle()
+    stat.update_comment_counter("altcoin", NOW - 3600)
+    assert counter.count("altcoin", NOW - 3600, NOW) == 3
+    assert sorted(counter.high_water_mark("altcoin")[1]) == ["t1_b", "t1_c"]
+
+    # nothing new => nothing is counted twice
+    stat.new_cycle()
+    stat.update_comment_counter("altcoin", NOW - 3600)
+    assert counter.count("altcoin", NOW - 3600, NOW) == 3
+
+
+def test_failed_fetch_leaves_the_counter_unchanged(tmp_path):
+    fake = FakeReddit.from_records([], now=NOW)
+    fake.listings[("altcoin", "comments")] = [comment("t1_a", NOW - 200)]
+    counter = CommentCounter(str(tmp_path / "counter.json"))
+    stat = stats_for(fake, counter)
+    stat.update_comment_counter("altcoin", NOW - 3600)
+
+    def failing_listing(subreddit, limit=100):
+        yield comment("t1_c", NOW - 10)
+        raise IOError("connection reset")
+
+    stat.get_comments = failing_listing
+    with pytest.raises(IOError):
+        stat.update_comment_counter("altcoin", NOW - 3600)
+    assert counter.high_water_mark("altcoin") == (NOW - 200, ["t1_a"], NOW - 3600)
+    assert counter.count("altcoin", NOW - 3600, NOW) == 1
+
+
+def test_missing_coverage_counts_everything_again(tmp_path):
+    fake = FakeReddit.from_records([], now=NOW)
+    fake.listings[("altcoin", "comments")] = [comment("t1_b", NOW - 100), comment("t1_a", NOW - 200)]
+    counter = CommentCounter(str(tmp_path / "counter.json"))
+    # streamed comments without a completed fetch have no coverage
+    counter.add("altcoin", NOW - 100, "t1_b")
+    assert counter.high_water_mark("altcoin")[2] is None
+    stat = stats_for(fake, counter)
+    stat.default_end = datetime.datetime.fromtimestamp(NOW)
+    rate, _ = stat.get_num_comments_per_hour("altcoin", hours=1)
+    assert rate == 2.
+    assert counter.high_water_mark("altcoin")[2] == NOW - 3600
+    assert counter.count("altcoin", NOW - 3600, NOW) == 2
+
+
+class StopStreaming(Exception):
+    pass
+
+
+def test_stream_backs_off_while_quiet_and_restarts_failed_streams(tmp_path, monkeypatch):
+    fake = FakeReddit.from_records([], now=NOW)
+    fake.listings[("altcoin", "comments")] = [comment("t1_a", NOW - 200)]
+    counter = CommentCounter(str(tmp_path / "counter.json"))
+    stat = stats_for(fake, counter)
+    stat.default_start = datetime.datetime.fromtimestamp(NOW - 3600)
+
+    def first_stream():
+        yield None
+        yield None
+        raise IOError("connection reset")
+
+    def restarted_stream():
+        # the newest comments again, t1_a was already counted
+        yield comment("t1_a", NOW - 200)
+        yield comment("t1_b", NOW - 50)
+        yield None
+        yield None
+
+    started = []
+
+    class FakeStream(object):
+
+        def comments(self, skip_existing, pause_after):
+            started.append(skip_existing)
+            return first_stream() if skip_existing else restarted_stream()
+
+    monkeypatch.setattr(FakeSubreddit, "stream", FakeStream(), raising=False)
+    pauses = []
+
+    def sleep(seconds):
+        pauses.append(seconds)
+        if len(pauses) == 4:
+            raise StopStreaming()
+
+    monkeypatch.setattr("reddit.time.sleep", sleep)
+    with pytest.raises(StopStreaming):
+        stat.stream_comments([["bitcoin", "Bitcoin", "BTC", "altcoin"]], save_interval=3600)
+    assert started == [True, False]
+    # quiet, quiet, failed, one new comment (no pause), quiet
+    assert pauses == [1, 2, 4, 1]
+    assert counter.count("altcoin", NOW - 3600, NOW) == 2
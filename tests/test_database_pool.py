@@ -0,0 +1,101 @@
+import threading
+
+import psycopg2
+import pytest
+
+import database
+
+
+class FakeCursor(object):
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool(object):
+
+    def __init__(self, *args, **kwargs):
+        self.free = []
+        self.closed = False
+
+    def getconn(self):
+        return self.free.pop() if self.free else FakeConnection()
+
+    def putconn(self, conn):
+        self.free.append(conn)
+
+    def closeall(self):
+        self.closed = True
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", FakePool)
+    db = database.PooledDatabaseConnection("db", "user", "password", max_connections=2)
+    db.schema_checked = True
+    return db
+
+
+def test_close_commits_and_returns_connection(db):
+    conn = db.conn
+    db.close()
+    assert conn.commits == 1 and conn.rollbacks == 0
+    assert db.pool.free == [conn]
+    assert db.checked_out == {}
+
+
+def test_failed_transaction_is_rolled_back(db):
+    conn = db.conn
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    db.close()
+    assert conn.commits == 0 and conn.rollbacks == 1
+
+
+def test_rollback(db):
+    conn = db.conn
+    db.rollback()
+    assert conn.commits == 0 and conn.rollbacks == 1
+    # a second close is a no-op
+    db.close()
+    assert conn.commits == 0
+
+
+def test_close_all_returns_connections_of_other_threads(db):
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.conn))
+    thread.start()
+    thread.join()
+    own = db.conn
+    pool = db.pool
+    db.close_all()
+    assert own.commits == 1
+    assert other[0].rollbacks == 1
+    assert pool.closed and db.checked_out == {}
+    # all slots were released
+    for _ in range(2):
+        assert db.slots.acquire(blocking=False)
+    for _ in range(2):
+        db.slots.release()
+    # the connection of this thread is replaced on the next query
+    assert db.conn is not own
@@ -0,0 +1,109 @@
+import datetime
+
+import numpy as np
+
+import query
+from settings import growth_features
+
+HOUR = datetime.timedelta(hours=1)
+END = datetime.datetime(2018, 1, 10, 12)
+
+
+class FakeGrowthDb(object):
+    """
+    In-memory data and growth tables with the queries used by query.refresh_growth_features and query.growth_at.
+    """
+
+    def __init__(self, data):
+        # rows of (subreddit, time, subscribers, submission_rate, comment_rate, mention_rate)
+        self.data = data
+        self.growth = {}
+
+    def get_first_and_last_data_in_interval(self, start, end, subreddits=None):
+        rows = {}
+        for row in sorted(self.data, key=lambda r: r[1]):
+            if start < row[1] < end and (subreddits is None or row[0] in subreddits):
+                first, _ = rows.get(row[0], (row, None))
+                rows[row[0]] = (first, row)
+        return [(sub,) + tuple(first[2:]) + tuple(last[2:]) for sub, (first, last) in rows.items()]
+
+    def get_collection_times(self, start, end):
+        return sorted(set(row[1] for row in self.data if start < row[1] < end))
+
+    def get_latest_growth_time(self, hours):
+        times = [time for (_, time, h) in self.growth if h == hours]
+        return max(times) if len(times) > 0 else None
+
+    def insert_growth_many(self, growth_dicts):
+        for g in growth_dicts:
+            self.growth.setdefault((g["subreddit"], g["time"], g["hours"]), g)
+
+    def get_growth_features(self, hours, timestamp, subreddits=None):
+        times = [time for (_, time, h) in self.growth if h == hours and time < timestamp]
+        if len(times) == 0:
+            return []
+        newest = max(times)
+        return [(g["subreddit"], g["time"], g["subscriber_growth"], g["submission_growth"],
+                 g["comment_growth"], g["mention_growth"])
+                for (sub, time, h), g in self.growth.items()
+                if h == hours and time == newest and (subreddits is None or sub in subreddits)]
+
+
+def synthetic_data():
+    rng = np.random.RandomState(0)
+    data = []
+    for i, sub in enumerate(["altcoin", "bitcoin", "ethereum"]):
+        # ethereum only has data for the last hours, bitcoin's mentions grow from zero
+        first = 6 if sub == "ethereum" else 60
+        for h in range(first, 0, -1):
+            time = END - h * HOUR + datetime.timedelta(minutes=17)
+            mentions = 0. if sub == "bitcoin" and h > 10 else rng.uniform(0, 5)
+            data.append((sub, time, 1000. + 10 * (60 - h) + i, rng.uniform(0, 3), rng.uniform(1, 30), mentions))
+    return data
+
+
+def collected_until(data, end):
+    return FakeGrowthDb([row for row in data if row[1] < end])
+
+
+def test_materialized_growths_equal_average_growth_at_read_time(monkeypatch):
+    monkeypatch.setitem(growth_features, "use_materialized", True)
+    monkeypatch.setitem(growth_features, "windows", [12])
+    data = synthetic_data()
+    subs = ["altcoin", "bitcoin", "ethereum"]
+    db = collected_until(data, END - 8 * HOUR)
+    for hours_before in range(8, 0, -1):
+        # main.collect: insert the rows of a collection, then refresh
+        collection = END - hours_before * HOUR + datetime.timedelta(minutes=17)
+        db.data = [row for row in data if row[1] <= collection]
+        query.refresh_growth_features(db, subs, collection + datetime.timedelta(seconds=30))
+        for minutes in (1, 40):
+            read_time = collection + datetime.timedelta(minutes=minutes)
+            live = query.average_growth(db, subs, read_time - 12 * HOUR, read_time)
+            materialized = query.materialized_growth(db, subs, read_time, 12)
+            assert [g[0] for g in materialized] == [g[0] for g in live]
+            assert np.allclose([g[1] for g in materialized], [g[1] for g in live])
+            assert query.growth_at(db, subs, read_time, 12) == materialized
+
+
+def test_growth_at_falls_back_to_the_data(monkeypatch):
+    monkeypatch.setitem(growth_features, "use_materialized", True)
+    monkeypatch.setitem(growth_features, "windows", [12])
+    data = synthetic_data()
+    collection = END - 5 * HOUR + datetime.timedelta(minutes=17)
+    db = collected_until(data, collection + datetime.timedelta(seconds=1))
+    query.refresh_growth_features(db, ["altcoin"], collection + datetime.timedelta(seconds=30))
+    # bitcoin was not materialized, it is computed for the same collection
+    read_time = collection + datetime.timedelta(minutes=10)
+    growths = dict((sub, g) for sub, g in query.growth_at(db, ["altcoin", "bitcoin"], read_time, 12))
+    live = dict((sub, g) for sub, g in query.average_growth(db, ["altcoin", "bitcoin"], read_time - 12 * HOUR,
+                                                            read_time))
+    assert np.isclose(growths["bitcoin"], live["bitcoin"])
+    # a newer collection is not materialized yet => computed from the data
+    db.data = data
+    read_time = collection + HOUR + datetime.timedelta(minutes=10)
+    assert query.materialized_growth(db, ["altcoin"], read_time, 12) is None
+    growths = query.growth_at(db, ["altcoin"], read_time, 12)
+    assert np.isclose(growths[0][1], query.average_growth(db, ["altcoin"], read_time - 12 * HOUR, read_time)[0][1])
+    # the materialized collection is too old
+    assert query.materialized_growth(db, ["altcoin"], END + 5 * HOUR, 12) is None
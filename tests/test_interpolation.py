@@ -0,0 +1,78 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import database
+
+T0 = datetime.datetime(2018, 1, 1, 12)
+HOUR = datetime.timedelta(hours=1)
+
+
+class FakeRowsConnection(object):
+    """
+    Returns the given rows (subreddit, time, metrics...) for the bracketing rows query
+    with the time in seconds since epoch like the query.
+    """
+
+    def __init__(self, rows):
+        self.rows = [(r[0], database.to_epoch_seconds([r[1]])[0]) + r[2:] for r in rows]
+
+    def cursor(self, name=None):
+        return FakeNamedCursor(self.rows)
+
+
+class FakeNamedCursor(object):
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def execute(self, querystr, params=None):
+        pass
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+def db_with_rows(rows):
+    db = database.DatabaseConnection.__new__(database.DatabaseConnection)
+    db.conn = FakeRowsConnection(rows)
+    return db
+
+
+def test_interpolation_between_two_rows():
+    price_db = db_with_rows([("bitcoin", T0, 10., 1., -4.), ("bitcoin", T0 + HOUR, 20., 3., 4.)])
+    timestamps = [T0, T0 + HOUR / 4, T0 + HOUR / 2, T0 + 2 * HOUR]
+    expected = [[10., 1., -4.], [12.5, 1.5, -2.], [15., 2., 0.], [20., 3., 4.]]
+    assert np.allclose(price_db.get_interpolated_price_series("bitcoin", timestamps), expected)
+    for t, e in zip(timestamps, expected):
+        assert np.allclose(price_db.get_interpolated_price_data("bitcoin", t), e)
+
+    data_db = db_with_rows([("bitcoin", T0, 100., 0., 10., 0., 0., 0., 0.),
+                            ("bitcoin", T0 + HOUR, 200., 4., 30., 2., 0., 0., 0.)])
+    assert np.allclose(data_db.get_interpolated_data("bitcoin", T0 + HOUR / 4), [125., 1., 15., 0.5, 0., 0., 0.])
+    assert np.allclose(data_db.get_interpolated_series(["bitcoin"], [T0 + HOUR / 4])["bitcoin"],
+                       [[125., 1., 15., 0.5, 0., 0., 0.]])
+
+
+def test_series_of_subreddits_split_across_chunks(monkeypatch):
+    monkeypatch.setitem(database.postgres, "itersize", 3)
+    rows = [(sub, T0 + h * HOUR, 10. * (i + 1) * (h + 1), 0., 0.)
+            for i, sub in enumerate(["altcoin", "bitcoin", "ethereum"]) for h in range(4)]
+    series = db_with_rows(rows).get_interpolated_price_series(["bitcoin", "ethereum", "altcoin"],
+                                                              [T0 + HOUR / 2, T0 + 5 * HOUR / 2])
+    assert np.allclose(series["altcoin"][:, 0], [15., 35.])
+    assert np.allclose(series["bitcoin"][:, 0], [30., 70.])
+    assert np.allclose(series["ethereum"][:, 0], [45., 105.])
+
+
+def test_interpolation_without_older_rows():
+    db = db_with_rows([("bitcoin", T0, 10., 1., -4.)])
+    with pytest.raises(ValueError):
+        db.get_interpolated_price_data("bitcoin", T0 - HOUR)
+    assert db_with_rows([]).get_interpolated_price_data("bitcoin", T0) is None
+    assert db_with_rows([]).get_interpolated_data("bitcoin", T0) == []
@@ -0,0 +1,47 @@
+import threading
+
+from coin_registry import CoinRegistry
+from fake_reddit import synthetic_coin_name_array
+import mentions
+from mentions import MentionMatcher, match_texts
+
+COINS = [
+    ["bitcoin", "Bitcoin", "BTC", "bitcoin"],
+    ["bitcoin-cash", "Bitcoin Cash", "BCH", "btc"],
+    ["ethereum", "Ethereum", "ETH", "ethereum"],
+]
+
+
+def test_matcher_respects_word_boundaries_and_case():
+    matcher = MentionMatcher(COINS)
+    assert sorted(matcher.match("Bitcoin cash is not BITCOIN")) == [0, 1]
+    assert sorted(matcher.match("eth and btc")) == [0, 1, 2]
+    assert sorted(matcher.match("ethereumclassic, bitcoins")) == []
+
+
+def test_parallel_matching_equals_serial_matching():
+    coins = synthetic_coin_name_array(50)
+    texts = ["{} and {} went up".format(coins[i % 50][1], coins[(i * 7) % 50][2]) for i in range(300)]
+    texts += ["nothing to see here"] * 20
+    serial = match_texts(coins, texts)
+    assert serial[0] == [0]
+    # spawned workers also work while other threads are running
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert match_texts(CoinRegistry(coins), texts, processes=2, chunk_size=64) == serial
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_the_pool_is_kept_across_calls():
+    coins = synthetic_coin_name_array(20)
+    texts = ["{} is up".format(coins[i % 20][2]) for i in range(100)]
+    assert match_texts(coins, texts, processes=2, chunk_size=16) == [[i % 20] for i in range(100)]
+    pool = mentions.pools[2]
+    # the workers build a new matcher for other coins
+    assert match_texts(coins[10:], texts, processes=2, chunk_size=16) == \
+        [[i % 20 - 10] if i % 20 >= 10 else [] for i in range(100)]
+    assert mentions.pools[2] is pool
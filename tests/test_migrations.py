@@ -0,0 +1,83 @@
+import threading
+import time
+
+import database
+
+
+class FakeServer(object):
+    """
+    The schema_version table and the advisory locks shared by all fake connections.
+    """
+
+    def __init__(self):
+        self.versions = []
+        self.statements = []
+        self.lock = threading.Lock()
+
+
+class FakeSchemaConnection(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.locked = False
+        self.inserted = []
+
+    def cursor(self):
+        return FakeSchemaCursor(self)
+
+    def __end__(self):
+        if self.locked:
+            self.locked = False
+            self.server.lock.release()
+
+    def commit(self):
+        self.server.versions += self.inserted
+        self.inserted = []
+        self.__end__()
+
+    def rollback(self):
+        self.inserted = []
+        self.__end__()
+
+
+class FakeSchemaCursor(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def execute(self, statement, params=None):
+        server = self.conn.server
+        if statement.startswith("SELECT pg_advisory_xact_lock"):
+            server.lock.acquire()
+            self.conn.locked = True
+        elif statement.startswith("SELECT max(version)"):
+            self.result = (max(server.versions) if server.versions else None,)
+        elif statement.startswith("INSERT INTO schema_version"):
+            self.conn.inserted.append(params[0])
+        elif not statement.startswith("CREATE TABLE IF NOT EXISTS schema_version"):
+            # give the other process a chance to run the same migration
+            time.sleep(0.001)
+            server.statements.append(statement)
+
+    def fetchone(self):
+        return self.result
+
+
+def connect(server):
+    db = database.DatabaseConnection.__new__(database.DatabaseConnection)
+    db.conn = FakeSchemaConnection(server)
+    db.cur = db.conn.cursor()
+    return db
+
+
+def test_concurrent_migrations_are_applied_once():
+    server = FakeServer()
+    threads = [threading.Thread(target=connect(server).migrate) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert server.versions == list(range(1, len(database.MIGRATIONS) + 1))
+    assert server.statements == [s for migration in database.MIGRATIONS for s in migration]
+    assert not server.lock.locked()
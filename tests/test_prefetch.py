@@ -0,0 +1,25 @@
+import settings
+from benchmark_collect import run_cycle
+from fake_reddit import FakeReddit, synthetic_coin_name_array
+from reddit import RedditStats
+
+
+def test_prefetched_listings_give_the_same_stats_as_separate_fetches():
+    coins = synthetic_coin_name_array(60)
+    subs = [coin[-1] for coin in coins]
+    separate = RedditStats(hours=4, reddit_factory=lambda: fake, mention_processes=1)
+    fake = FakeReddit(coins, now=separate.default_end.timestamp())
+    prefetched = RedditStats(hours=4, reddit_factory=lambda: fake, mention_processes=1)
+    prefetched.default_start, prefetched.default_end = separate.default_start, separate.default_end
+
+    prefetched.prefetch_listings(subs, separate.default_start.timestamp(), group_size=20)
+    for sub in subs:
+        assert prefetched.get_num_comments_per_hour(sub) == separate.get_num_comments_per_hour(sub)
+        assert prefetched.get_num_submissions_per_hour(sub) == separate.get_num_submissions_per_hour(sub)
+        assert prefetched.get_hourly_activity(sub) == separate.get_hourly_activity(sub)
+
+
+def test_benchmark_cycle_restores_the_settings():
+    saved = dict(settings.reddit)
+    run_cycle(synthetic_coin_name_array(10), hours=2, group_size=5, lean=True)
+    assert settings.reddit == saved
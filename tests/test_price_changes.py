@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+
+import query
+
+START = datetime.datetime(2018, 1, 1)
+
+
+class FakePriceDb(object):
+    """
+    In-memory price table with the queries used by query.price_changes.
+    """
+
+    def __init__(self, rows):
+        # rows of (subreddit, time, price)
+        self.rows = rows
+
+    def get_all_price_data_in_interval(self, start, end):
+        rows = sorted((r for r in self.rows if start < r[1] < end), key=lambda r: r[1], reverse=True)
+        return [(r[0], r[2]) for r in rows]
+
+    def get_first_and_last_price_in_interval(self, start, end, subreddits=None):
+        newest_first = [r for r in sorted(self.rows, key=lambda r: r[1], reverse=True) if start < r[1] < end and
+                        (subreddits is None or r[0] in subreddits)]
+        result = []
+        for sub in dict.fromkeys(r[0] for r in newest_first):
+            prices = [r[2] for r in newest_first if r[0] == sub]
+            result.append((sub, prices[-1], prices[0]))
+        return result
+
+
+def original_top_gainers(price_data, all_subs, n):
+    """
+    The ranking of the stagnation helpers before price_changes (scan of all rows, newest first).
+    """
+    price_changes = []
+    for subreddit in all_subs:
+        prices = [line[1] for line in price_data if line[0] == subreddit]
+        if len(prices) == 0 or prices[0] == 0 or prices[-1] == 0:
+            price_changes.append((subreddit, float('inf')))
+        else:
+            price_changes.append((subreddit, (prices[0] - prices[-1]) / prices[-1]))
+    price_changes = sorted(price_changes, key=lambda subr: subr[1])
+    price_changes.reverse()
+    return [c[0] for c in price_changes[:n]]
+
+
+def price_db():
+    rows = []
+    for i, (sub, old, new) in enumerate([("altcoin", 1., 2.), ("bitcoin", 0., 5.), ("dogecoin", 2., 1.),
+                                         ("ethereum", 3., 0.), ("litecoin", 1., 1.5), ("monero", 4., 4.)]):
+        rows.append((sub, START + datetime.timedelta(minutes=10 + i), old))
+        rows.append((sub, START + datetime.timedelta(hours=2, minutes=i), new))
+    return FakePriceDb(rows)
+
+
+def test_top_gainers_keep_the_original_tie_order():
+    db = price_db()
+    end = START + datetime.timedelta(hours=3)
+    price_data = db.get_all_price_data_in_interval(START, end)
+    subs = ["ripple", "monero", "bitcoin", "altcoin", "stellar", "ethereum", "dogecoin", "litecoin"]
+    for n in range(1, len(subs) + 1):
+        ranked, _ = query.price_changes(db, START, end, subs, include_missing=True)
+        assert list(ranked[:n]) == original_top_gainers(price_data, subs, n)
+        assert query.top_price_gainers(db, START, end, n, subs) == set(original_top_gainers(price_data, subs, n))
+    # without subreddits the order of the newest prices is used
+    seen = list(dict.fromkeys(line[0] for line in price_data))
+    ranked, _ = query.price_changes(db, START, end)
+    assert list(ranked) == original_top_gainers(price_data, seen, len(seen))
+
+
+def test_percentage_price_growths_keep_their_sign():
+    db = price_db()
+    growths = query.percentage_price_growths(db, ["dogecoin", "altcoin", "ripple", "litecoin"], START,
+                                             START + datetime.timedelta(hours=3))
+    # (oldest - newest) / newest
+    assert [g[0] for g in growths] == ["altcoin", "litecoin", "dogecoin"]
+    assert np.allclose([g[1] for g in growths], [-50., -100. / 3, 100.])
@@ -0,0 +1,33 @@
+import time
+
+from benchmark_collect import run_cycle
+from fake_reddit import FakeReddit, synthetic_coin_name_array
+from reddit import RedditStats, RequestBudget
+
+
+def test_acquire_paces_requests():
+    budget = RequestBudget(60 * 50)
+    start = time.time()
+    for _ in range(6):
+        budget.acquire()
+    # the first request is immediate, every further one waits 20ms
+    assert time.time() - start >= 0.09
+    assert budget.requests == 6
+
+
+def test_only_fetched_pages_are_charged():
+    budget = RequestBudget(10 ** 6)
+    stat = RedditStats(hours=2, budget=budget, reddit_factory=lambda: fake)
+    fake = FakeReddit(synthetic_coin_name_array(5), now=stat.default_end.timestamp())
+    listing = stat.get_comments("fakecoin0", limit=1024)
+    assert budget.requests == 0
+    for i, _ in enumerate(listing):
+        if i == 150:
+            break
+    assert budget.requests == fake.requests == 2
+
+
+def test_budget_charges_every_request_of_a_cycle():
+    wall, requests, cpu, charged = run_cycle(synthetic_coin_name_array(30), workers=2, hours=2,
+                                             requests_per_minute=10 ** 6)
+    assert charged == requests > 0
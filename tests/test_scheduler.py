@@ -0,0 +1,48 @@
+import json
+import threading
+import time
+
+from scheduler import Job, Scheduler
+
+
+def test_runs_are_recorded_and_failures_do_not_stop_the_job(tmp_path):
+    calls = []
+
+    def failing():
+        calls.append(time.time())
+        raise ValueError("failed run")
+
+    stats_file = str(tmp_path / "stats.json")
+    job = Job("failing", 0.05, failing)
+    scheduler = Scheduler([job], stats_file)
+    scheduler.start()
+    time.sleep(0.3)
+    scheduler.stop()
+    assert job.runs >= 3
+    assert job.failures == job.runs == len(calls)
+    stats = json.load(open(stats_file))
+    assert stats["failing"]["runs"] == job.runs
+    assert stats["failing"]["mean_duration"] is not None
+
+
+def test_runs_of_a_job_never_overlap():
+    running = threading.Lock()
+    overlaps = []
+
+    def slow():
+        if not running.acquire(blocking=False):
+            overlaps.append(True)
+            return
+        time.sleep(0.12)
+        running.release()
+
+    job = Job("slow", 0.05, slow)
+    scheduler = Scheduler([job])
+    scheduler.start()
+    time.sleep(0.5)
+    scheduler.stop()
+    assert overlaps == []
+    assert job.runs >= 2
+    # every run took longer than the interval => the missed runs were skipped
+    assert job.skipped >= job.runs - 1
+    assert min(job.durations) >= 0.12
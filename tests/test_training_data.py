@@ -0,0 +1,61 @@
+import datetime
+
+import numpy as np
+
+import query
+from training_data import TrainingDataStore
+
+
+def test_store_index_survives_reload(tmp_path):
+    end = datetime.datetime(2018, 1, 1, 12)
+    store = TrainingDataStore(str(tmp_path))
+    store.add(end, ["altcoin", "bitcoin"], [[1., 2.], [3., 4.]])
+    store.add(end, ["ethereum"], [[5., 6.]])
+    assert store.missing(end, ["altcoin", "ethereum", "litecoin"]) == ["litecoin"]
+
+    reloaded = TrainingDataStore(str(tmp_path))
+    assert reloaded.missing(end, ["altcoin", "ethereum", "litecoin"]) == ["litecoin"]
+    assert reloaded.missing(end + datetime.timedelta(hours=1), ["altcoin"]) == ["altcoin"]
+    coins, end_times, data = reloaded.load()
+    assert coins == ["altcoin", "bitcoin", "ethereum"]
+    assert end_times == [end] * 3
+    assert np.array_equal(data, [[1., 2.], [3., 4.], [5., 6.]])
+
+
+class FakePriceDb(object):
+
+    def __init__(self, latest_price_time):
+        self.latest_price_time = latest_price_time
+
+    def get_latest_price_time(self):
+        return self.latest_price_time
+
+
+def test_prep_skips_ends_whose_label_is_not_observable(tmp_path, monkeypatch):
+    computed = []
+
+    def fake_growths(db, coins, end, hours=24, include_future_growth=True):
+        computed.append(end)
+        return np.ones((len(coins), 3))
+
+    monkeypatch.setattr(query, "sub_and_price_growths", fake_growths)
+    coin_name_array = [["bitcoin", "Bitcoin", "BTC", "bitcoin"]]
+    store = TrainingDataStore(str(tmp_path))
+    hour_ago = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=1)
+    # the 4h labels of the ends 1h and 2h before hour_ago lie after the newest price
+    db = FakePriceDb(hour_ago + datetime.timedelta(hours=1))
+    query.prep_training_data(db, coin_name_array, datetime.timedelta(hours=1), 4, store=store, hours=4)
+    assert sorted(computed) == [hour_ago - datetime.timedelta(hours=i) for i in (4, 3)]
+
+    # once the prices exist the skipped end times are filled in, the stored ones are kept
+    computed[:] = []
+    db.latest_price_time = hour_ago + datetime.timedelta(hours=3)
+    query.prep_training_data(db, coin_name_array, datetime.timedelta(hours=1), 4, store=store, hours=4)
+    assert sorted(computed) == [hour_ago - datetime.timedelta(hours=i) for i in (2, 1)]
+
+
+def test_prep_without_price_data_stores_nothing(tmp_path):
+    store = TrainingDataStore(str(tmp_path))
+    query.prep_training_data(FakePriceDb(None), [["bitcoin", "Bitcoin", "BTC", "bitcoin"]],
+                             datetime.timedelta(hours=1), 2, store=store)
+    assert store.load()[0] == []
@@ -0,0 +1,73 @@
+import datetime
+import os
+
+import numpy as np
+
+import util
+from settings import general
+
+log = util.setup_logger(__name__)
+
+TIME_FORMAT = "%Y%m%d%H%M"
+
+
+class TrainingDataStore(object):
+    """
+    Stores training data rows in compressed NPZ chunks (one chunk per end time and build run)
+    and keeps an index of the (end_time, coin) pairs which are already materialized.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = general["training_data_dir"]
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # maps end time -> set of coins
+        self.index = {}
+        for file_name in self.__chunk_files__():
+            with np.load(os.path.join(self.path, file_name)) as chunk:
+                end_time = datetime.datetime.strptime(str(chunk["end_time"]), TIME_FORMAT)
+                self.index.setdefault(end_time, set()).update(chunk["coins"].tolist())
+
+    def __chunk_files__(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith(".npz"))
+
+    def missing(self, end_time, coins):
+        """
+        Returns those coins which have no row for end_time yet.
+        """
+        known = self.index.get(end_time, set())
+        return [c for c in coins if c not in known]
+
+    def add(self, end_time, coins, data):
+        """
+        Writes the rows in data (one per coin) for end_time into a new chunk.
+        """
+        if len(coins) == 0:
+            return
+        assert len(coins) == len(data)
+        end_str = end_time.strftime(TIME_FORMAT)
+        nr = 0
+        while os.path.exists(os.path.join(self.path, "{}_{}.npz".format(end_str, nr))):
+            nr += 1
+        np.savez_compressed(os.path.join(self.path, "{}_{}.npz".format(end_str, nr)),
+                            end_time=end_str, coins=np.array(coins), data=np.asarray(data, dtype=float))
+        self.index.setdefault(end_time, set()).update(coins)
+        log.info("Stored %s training rows for %s." % (len(coins), end_time))
+
+    def load(self):
+        """
+        Returns all stored rows as tuple (coins, end_times, data) sorted by end time.
+        """
+        coins = []
+        end_times = []
+        data = []
+        for file_name in self.__chunk_files__():
+            with np.load(os.path.join(self.path, file_name)) as chunk:
+                end_time = datetime.datetime.strptime(str(chunk["end_time"]), TIME_FORMAT)
+                coins += chunk["coins"].tolist()
+                end_times += [end_time] * len(chunk["coins"])
+                data.append(chunk["data"])
+        if len(data) == 0:
+            return [], [], np.empty((0, 0))
+        return coins, end_times, np.vstack(data)
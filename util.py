@@ -1,6 +1,7 @@
 import json
 import logging
 
+from coin_registry import CoinRegistry
 from settings import general
 
 logger = None
@@ -92,29 +93,42 @@ def merge_coin_arrays(arr1, arr2):
     Merges two coin name arrays.
     Prints to log if there are conflicting entries.
     """
+    by_symbol2 = {}
+    for a2 in arr2:
+        by_symbol2.setdefault(a2[-2], []).append(a2)
     result = []
+    symbols1 = set()
     for a1 in arr1:
         result.append(a1)
-        for a2 in arr2:
-            if a1[-2] == a2[-2] and a1 != a2:
+        symbols1.add(a1[-2])
+        for a2 in by_symbol2.get(a1[-2], []):
+            if list(a1) != list(a2):
                 log.info("Conflicting entries:")
                 log.info(a1)
                 log.info(a2)
 
     for a2 in arr2:
-        if not a2[-2] in [a1[-2] for a1 in arr1]:
+        if not a2[-2] in symbols1:
             result.append(a2)
     return result
 
 def get_symbol_for_sub(coin_name_array, subreddit):
     """
     Returns the symbol for a given subreddit.
+    Lookups in a CoinRegistry use its index, pass one for repeated lookups.
     """
+    if isinstance(coin_name_array, CoinRegistry):
+        return coin_name_array.symbol_for_sub(subreddit)
     for coin in coin_name_array:
         if coin[-1] == subreddit:
             return coin[-2]
 
 def get_subs_for_symbol(coin_name_array, symbol):
+    if isinstance(coin_name_array, CoinRegistry):
+        result = coin_name_array.subs_for_symbol(symbol)
+        if len(result) > 1:
+            log.warn("Found 2 or more subreddits for %s pls resolve manually." % (symbol))
+        return result
     found_sub = False
     result = []
     for coin in coin_name_array:
@@ -129,10 +143,19 @@ def known_subs_for_symbols(coin_name_array, symbols):
     """
     Finds already known subs for a list of symbols.
     """
+    if isinstance(coin_name_array, CoinRegistry):
+        subs_for_symbol = coin_name_array.subs_for_symbol
+    else:
+        subs_by_symbol = {}
+        for coin in coin_name_array:
+            subs_by_symbol.setdefault(coin[-2], []).append(coin[-1])
+        subs_for_symbol = lambda symbol: subs_by_symbol.get(symbol, [])
     not_found = []
     result = []
     for symbol in symbols:
-        subs = get_subs_for_symbol(coin_name_array, symbol)
+        subs = subs_for_symbol(symbol)
+        if len(subs) > 1:
+            log.warn("Found 2 or more subreddits for %s pls resolve manually." % (symbol))
         if len(subs) >= 1:
             result.append(subs[0])
         else:
@@ -143,6 +166,8 @@ def get_coin_from_symbol(coin_name_array, symbol):
     """
     Returns the coin (i.e. one line of the coin_name_array) corresponding to symbol
     """
+    if isinstance(coin_name_array, CoinRegistry):
+        return coin_name_array.coin_for_symbol(symbol)
     for coin in coin_name_array:
         if coin[-2] == symbol:
             return coin